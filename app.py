@@ -5,13 +5,24 @@ from decimal import Decimal, InvalidOperation
 from functools import wraps
 
 from flask import (
-    Flask, render_template, request, redirect, url_for, flash, session, g
+    Flask, render_template, request, redirect, url_for, flash, session, g, send_file, abort, current_app
 )
-from sqlalchemy import text, func, and_, cast, Date, literal
+from sqlalchemy import text, func, and_, or_, cast, Date, literal, select, update
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # 确保 models.py 里包含 db = SQLAlchemy()，以及下列模型
-from models import db, Bet2D, WinningRecord2D, Agent, DrawResult
+from models import (
+    db, Bet2D, WinningRecord2D, Agent, DrawResult, Bet2DArchive, WinningRecord2DArchive,
+    WinningSummary2D, WinningDaySummary2D, SummarizedDay2D,
+)
+from archive_2d import has_archived_days
+import profiler_2d
+from bet_writer_2d import init_bet_writer
+import draw_stats_2d   # 注册 DrawResult 写入时的统计维护钩子
+import shards_2d
+import number_mask_2d
+import settle_digest_2d
+import win_summary_2d
 
 MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
 MARKETS = ["MGV21", "UCA68", "SFC99"]
@@ -50,6 +61,43 @@ def _fix_db_url(url: str) -> str:
 
 
 # ---------- 工具函数 ----------
+def ensure_schema(app: Flask) -> None:
+    """启动时补建缺失的表（归档、统计等新表，含各分库）和已有表上缺失的索引
+    （如 draw_results.ix_draw_market_code），并给已有注单表补多号码两列
+    （number_mask / number_count，只加列不改数据）。AUTO_SCHEMA=0 可关闭；
+    库不可达时只记日志，不阻止启动"""
+    if os.environ.get("AUTO_SCHEMA", "1") != "1":
+        return
+    with app.app_context():
+        try:
+            db.create_all()
+            shards_2d.init_tables()
+        except Exception:
+            app.logger.exception("启动建表失败，可手动执行 python archive_2d.py --init")
+        # create_all 只建缺失的表，不会给已存在的表补索引；逐个 checkfirst 补建
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(db.engine, checkfirst=True)
+                except Exception:
+                    app.logger.exception(f"启动补建索引 {index.name} 失败")
+        for key, engine in db.engines.items():
+            try:
+                added = number_mask_2d.init_columns(engine)
+            except Exception:
+                # 多个 worker 同时启动时可能撞上对方刚加的列，记日志即可
+                app.logger.exception("启动补列失败，可手动执行 python number_mask_2d.py --init")
+                continue
+            if added:
+                app.logger.warning(f"已补列（{key or 'default'}）：{', '.join(added)}")
+
+
+def code_in_days(code_col, start: date, end: date):
+    """期号 YYYYMMDD/HHMM 落在 [start, end]：按字符串比较，PostgreSQL / SQLite 通用且能用上 code 索引"""
+    return and_(code_col >= start.strftime("%Y%m%d"),
+                code_col < (end + timedelta(days=1)).strftime("%Y%m%d"))
+
+
 def parse_code_to_hour(code: str) -> datetime:
     # 20250906/1950 -> 2025-09-06 19:00 +08:00
     y = int(code[0:4]); m = int(code[4:6]); d = int(code[6:8]); h = int(code[9:11])
@@ -91,6 +139,192 @@ def next_slot_code(now: datetime | None = None) -> str:
     return f"{day.strftime('%Y%m%d')}/{hour:02d}50"
 
 
+# ---------- 幂等计算：按日期对比并落库中奖 ----------
+def web_hits(b, dr, head: str, specials_set: set) -> list[tuple[str, str, Decimal]]:
+    """结算页引擎的命中规则：一注对一期开奖，返回 [(hit_type, 号码, stake)]（大小单双按开奖 size_type/parity_type）"""
+    # N1 / N：单号码或多号码掩码
+    hits = number_mask_2d.number_hits(b, head, specials_set)
+
+    # 大/小（按开奖 size_type），多号码注单本金 × 号码个数
+    num = number_mask_2d.attr_number(b)
+    if dr.size_type == "大" and (b.amount_b or Decimal("0")) > 0:
+        hits.append(("B", num, number_mask_2d.attr_stake(b, b.amount_b)))
+    if dr.size_type == "小" and (b.amount_s or Decimal("0")) > 0:
+        hits.append(("S", num, number_mask_2d.attr_stake(b, b.amount_s)))
+
+    # 单/双（按开奖 parity_type）
+    if dr.parity_type == "单" and (b.amount_ds or Decimal("0")) > 0:
+        hits.append(("DS", num, number_mask_2d.attr_stake(b, b.amount_ds)))
+    if dr.parity_type == "双" and (b.amount_ss or Decimal("0")) > 0:
+        hits.append(("SS", num, number_mask_2d.attr_stake(b, b.amount_ss)))
+    return hits
+
+
+def compute_and_persist_wins_for_date(target_day: date) -> int:
+    """
+    幂等：对 target_day 的所有开奖(code=YYYYMMDD/HHMM)逐个比对当期注单，写入 winning_record_2d。
+    - 仅处理 Bet2D.status != 'delete'
+    - Bet2D.market 是合并字符串（如 'MPT'），只要包含开奖 market 即视为该市场下注
+    - 每次命中前检查是否已存在相同 (bet_id, code, market, hit_type, number) 记录，避免重复
+    - 多号码掩码注单按掩码判断命中，不展开成行
+    - 有新增的期号在同一事务内重算中奖汇总（win_summary_2d，SAVEPOINT 内，失败交给补算任务）
+    - 同时记下本引擎全部命中（含已存在的）的结算摘要（settle_digest_2d），供对账直接比对
+    - 按市场拆库时，注单与中奖记录都在该市场所在的库
+    返回：本次新增的记录条数
+    """
+    day_prefix = target_day.strftime("%Y%m%d") + "/"
+    draws = (db.session.query(DrawResult)
+             .filter(DrawResult.code.like(f"{day_prefix}%"))
+             .all())
+
+    inserted = 0
+    touched: dict = {}   # session -> 有新增中奖的期号
+    digests = {sess: settle_digest_2d.Digest("web") for sess in shards_2d.all_sessions()}
+    archived = has_archived_days(target_day, target_day)
+
+    for dr in draws:
+        code = dr.code
+        mkt_norm = (dr.market or "").replace(" ", "")
+        head = (dr.head or "").strip()
+        sess = shards_2d.session_for(mkt_norm)
+        for d in digests.values():
+            d.settle(code)
+       
+        specials_set = set()
+        if (dr.specials or "").strip():
+            specials_set = {s.strip() for s in dr.specials.split(",") if s.strip()}
+
+        # 取当期、包含该市场的注单（排除 delete）
+        bets = (
+            sess.query(Bet2D)
+            .filter(
+                Bet2D.status != "delete",
+                Bet2D.code == code,
+                # ',' || 去空格后的 market || ','  LIKE  '%,MGV21,%'（|| 在 PostgreSQL / SQLite 通用）
+                (literal(',') + func.replace(func.coalesce(Bet2D.market, ''), ' ', '') + ',')
+                .like(f"%,{mkt_norm},%")
+            )
+            .all()
+        )
+
+        for b in bets:
+            # 逐类判断命中；命中则写入（先查重）
+            for hit_type, number, stake in web_hits(b, dr, head, specials_set):
+                digests[sess].add(code, mkt_norm, b.agent_id, hit_type, number, stake, ODDS_2D_MULTIPLIER[hit_type])
+                exists = (sess.query(WinningRecord2D.id)
+                          .filter_by(bet_id=b.id, code=code, market=mkt_norm, hit_type=hit_type, number=number)
+                          .first())
+                if exists:
+                    continue
+                odds = ODDS_2D_MULTIPLIER[hit_type]
+                payout = (Decimal(stake) * (odds - Decimal("1"))).quantize(Decimal("0.01"))
+                rec = WinningRecord2D(
+                    bet_id=b.id,
+                    agent_id=b.agent_id,
+                    market=mkt_norm,
+                    code=code,
+                    number=number,
+                    hit_type=hit_type,
+                    stake=Decimal(stake).quantize(Decimal("0.01")),
+                    odds=odds,
+                    payout=payout
+                )
+                sess.add(rec)
+                touched.setdefault(sess, set()).add(code)
+                inserted += 1
+
+    for sess, digest in digests.items():
+        if sess in touched and not win_summary_2d.summarize_or_defer(sess, touched[sess]):
+            current_app.logger.error("中奖汇总重算失败，已交给补算任务：%s", sorted(touched[sess]))
+        if not archived:   # 已归档的日期在线表没有注单，不能用空结果覆盖摘要
+            try:
+                with sess.begin_nested():   # 摘要只供对账，写失败不影响中奖记录入库
+                    digest.save(sess)
+            except Exception:
+                current_app.logger.exception("结算摘要写入失败")
+        sess.commit()
+    return inserted
+
+
+# ---------- 批量撤单：一条条件 UPDATE ... RETURNING ----------
+MAX_CANCEL_ORDERS = 500
+
+
+def _cancel_in(sess, codes: list[str], agent_name: str | None, now: datetime):
+    """在单个库上执行撤单，返回 ({order_code: 行数}, {已锁注的 order_code})"""
+    owned = [Bet2D.order_code.in_(codes), Bet2D.status != "delete"]
+    if agent_name:
+        owned.append(Bet2D.agent_id == agent_name)
+
+    locked_orders = (
+        select(Bet2D.order_code)
+        .where(*owned, or_(Bet2D.locked_at <= now, Bet2D.status == "locked"))
+    )
+    stmt = (
+        update(Bet2D)
+        .where(*owned, Bet2D.order_code.not_in(locked_orders))
+        .values(status="delete")
+        .returning(Bet2D.order_code)
+        .execution_options(synchronize_session=False)
+    )
+    counts: dict[str, int] = {}
+    for (oc,) in sess.execute(stmt):
+        counts[oc] = counts.get(oc, 0) + 1
+
+    locked: set[str] = set()
+    missing = [c for c in codes if c not in counts]
+    if missing:
+        # 只为失败的订单区分“已锁注”与“不存在/无权限”
+        locked = {oc for (oc,) in sess.execute(
+            select(Bet2D.order_code).where(
+                Bet2D.order_code.in_(missing), *owned[1:],
+                or_(Bet2D.locked_at <= now, Bet2D.status == "locked"))
+            .distinct()
+        )}
+    return counts, locked
+
+
+def cancel_orders(order_codes: list[str], agent_name: str | None = None,
+                  now: datetime | None = None) -> dict[str, dict]:
+    """
+    在一条 UPDATE 里把多张订单置为 delete，归属与锁注判断都放在 WHERE 中：
+    - agent_name 非空时只动该代理的注单
+    - 订单内任一行已过 locked_at（或已被调度器置为 locked）则整单不动
+    - 按市场拆库时每个库各执行一条，结果合并后统一提交
+    返回 {order_code: {"ok": True, "count": n} | {"ok": False, "locked": bool, "error": ...}}
+    """
+    now = now or datetime.now(MY_TZ)
+    codes = list(dict.fromkeys(c.strip() for c in order_codes if c and c.strip()))
+    if not codes:
+        return {}
+
+    sessions = shards_2d.all_sessions()
+    counts: dict[str, int] = {}
+    locked: set[str] = set()
+    try:
+        for sess in sessions:
+            c, l = _cancel_in(sess, codes, agent_name, now)
+            for oc, n in c.items():
+                counts[oc] = counts.get(oc, 0) + n
+            locked |= l
+        for sess in sessions:
+            sess.commit()
+    except Exception:
+        for sess in sessions:
+            sess.rollback()
+        raise
+
+    results = {}
+    for c in codes:
+        if c in counts:
+            results[c] = {"ok": True, "count": counts[c]}
+        elif c in locked:
+            results[c] = {"ok": False, "locked": True, "error": "订单已锁注，不能删除"}
+        else:
+            results[c] = {"ok": False, "locked": False, "error": "未找到该订单或无权限"}
+    return results
+
+
 # ========================= 应用工厂 =========================
 def create_app() -> Flask:
     app = Flask(__name__)
@@ -101,104 +335,13 @@ def create_app() -> Flask:
         SQLALCHEMY_DATABASE_URI=db_url,
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         SQLALCHEMY_ENGINE_OPTIONS={"pool_pre_ping": True, "pool_recycle": 300},
+        SQLALCHEMY_BINDS={k: _fix_db_url(v) for k, v in shards_2d.shard_binds().items()},
     )
     db.init_app(app)
-
-    # ---------- 幂等计算：按日期对比并落库中奖 ----------
-    def compute_and_persist_wins_for_date(target_day: date) -> int:
-        """
-        幂等：对 target_day 的所有开奖(code=YYYYMMDD/HHMM)逐个比对当期注单，写入 winning_record_2d。
-        - 仅处理 Bet2D.status != 'delete'
-        - Bet2D.market 是合并字符串（如 'MPT'），只要包含开奖 market 即视为该市场下注
-        - 每次命中前检查是否已存在相同 (bet_id, code, market, hit_type) 记录，避免重复
-        返回：本次新增的记录条数
-        """
-        day_prefix = target_day.strftime("%Y%m%d") + "/"
-        draws = (db.session.query(DrawResult)
-                 .filter(DrawResult.code.like(f"{day_prefix}%"))
-                 .all())
-
-        inserted = 0
-
-        for dr in draws:
-            code = dr.code
-            mkt_norm = (dr.market or "").replace(" ", "")
-            head = (dr.head or "").strip()
-           
-            specials_set = set()
-            if (dr.specials or "").strip():
-                specials_set = {s.strip() for s in dr.specials.split(",") if s.strip()}
-
-            # 取当期、包含该市场的注单（排除 delete）
-            bets = (
-                db.session.query(Bet2D)
-                .filter(
-                    Bet2D.status != "delete",
-                    Bet2D.code == code,
-                    func.concat(
-                        ',',
-                        func.replace(func.coalesce(Bet2D.market, ''), ' ', ''),  # <-- 去空格
-                        ','
-                    ).like(func.concat('%,', literal(mkt_norm), ',%'))         # <-- 用 mkt_norm
-                )
-                .all()
-            )
-
-            for b in bets:
-                # 逐类判断命中；命中则写入（先查重）
-                def _ensure_write(hit_type: str, stake: Decimal):
-                    nonlocal inserted
-                    if stake is None:
-                        return
-                    if Decimal(stake or 0) <= 0:
-                        return
-                    exists = (db.session.query(WinningRecord2D.id)
-                              .filter_by(bet_id=b.id, code=code, market=mkt_norm, hit_type=hit_type)
-                              .first())
-                    if exists:
-                        return
-                    odds = ODDS_2D_MULTIPLIER[hit_type]
-                    payout = (Decimal(stake) * (odds - Decimal("1"))).quantize(Decimal("0.01"))
-                    rec = WinningRecord2D(
-                        bet_id=b.id,
-                        agent_id=b.agent_id,
-                        market=mkt_norm,
-                        code=code,
-                        number=b.number,
-                        hit_type=hit_type,
-                        stake=Decimal(stake).quantize(Decimal("0.01")),
-                        odds=odds,
-                        payout=payout
-                    )
-                    db.session.add(rec)
-                    inserted += 1
-
-                # N1：只中头奖
-                if (b.amount_n1 or Decimal("0")) > 0 and b.number == head:
-                    _ensure_write("N1", b.amount_n1)
-
-                # N：分头奖/特别奖
-                if (b.amount_n or Decimal("0")) > 0:
-                    if b.number == head:
-                        _ensure_write("N_HEAD", b.amount_n)
-                    elif b.number in specials_set:
-                        _ensure_write("N_SPECIAL", b.amount_n)
-
-                # 大/小（按开奖 size_type）
-                if dr.size_type == "大" and (b.amount_b or Decimal("0")) > 0:
-                    _ensure_write("B", b.amount_b)
-                if dr.size_type == "小" and (b.amount_s or Decimal("0")) > 0:
-                    _ensure_write("S", b.amount_s)
-
-                # 单/双（按开奖 parity_type）
-                if dr.parity_type == "单" and (b.amount_ds or Decimal("0")) > 0:
-                    _ensure_write("DS", b.amount_ds)
-                if dr.parity_type == "双" and (b.amount_ss or Decimal("0")) > 0:
-                    _ensure_write("SS", b.amount_ss)
-
-        if inserted:
-            db.session.commit()
-        return inserted
+    ensure_schema(app)
+    shards_2d.init_shards(app)
+    profiler_2d.init_profiler(app)
+    init_bet_writer(app)
 
     # ------------- 简单会话/权限 -------------
     def login_required(f):
@@ -237,61 +380,69 @@ def create_app() -> Flask:
             start_date = end_date = datetime.now().date()
             start_date_str = end_date_str = today_str
 
-        # 口径：按开奖 code 的日期
-        bet_date_col = func.to_date(func.substr(Bet2D.code, 1, 8), 'YYYYMMDD')
-        win_date_col = func.to_date(func.substr(WinningRecord2D.code, 1, 8), 'YYYYMMDD')
-
-        # 营业额（金额合计 × 市场数），market 为逗号分隔 "MGV21,UCA68"
-        base_amount = (
-            func.coalesce(Bet2D.amount_n1, 0) +
-            func.coalesce(Bet2D.amount_n,  0) +
-            func.coalesce(Bet2D.amount_b,  0) +
-            func.coalesce(Bet2D.amount_s,  0) +
-            func.coalesce(Bet2D.amount_ds, 0) +
-            func.coalesce(Bet2D.amount_ss, 0)
-        )
-        market_field = func.coalesce(Bet2D.market, "")
-        market_count = func.coalesce(
-            (func.length(market_field) - func.length(func.replace(market_field, ",", "")) + 1),
-            0
-        )
-
-        sales_q = (
-            db.session.query(
-                Bet2D.agent_id.label('agent_id'),  # 这里就是“用户名”
-                func.coalesce(func.sum(base_amount * market_count), 0).label('sales')
+        # 口径：按开奖 code 的日期（归档表直接用 day 列）
+        def sales_query(model, in_range):
+            # 营业额（金额合计 × 市场数 × 号码个数），market 为逗号分隔 "MGV21,UCA68"
+            base_amount = (
+                func.coalesce(model.amount_n1, 0) +
+                func.coalesce(model.amount_n,  0) +
+                func.coalesce(model.amount_b,  0) +
+                func.coalesce(model.amount_s,  0) +
+                func.coalesce(model.amount_ds, 0) +
+                func.coalesce(model.amount_ss, 0)
             )
-            .filter(
-                Bet2D.status != 'delete',
-                bet_date_col >= start_date,
-                bet_date_col <= end_date
+            market_field = func.coalesce(model.market, "")
+            market_count = func.coalesce(
+                (func.length(market_field) - func.length(func.replace(market_field, ",", "")) + 1),
+                0
             )
-            .group_by(Bet2D.agent_id)
-        )
-        if role != 'admin' and current_agent_name:
-            sales_q = sales_q.filter(Bet2D.agent_id == current_agent_name)
-        sales_by_agent = {row.agent_id: Decimal(row.sales or 0) for row in sales_q.all()}
-
-        # 中奖金额（含本金）
-        win_q = (
-            db.session.query(
-                WinningRecord2D.agent_id.label('agent_id'),  # 这里同样是“用户名”
-                func.coalesce(
-                    func.sum(
-                        func.coalesce(WinningRecord2D.stake, 0) *
-                        func.coalesce(WinningRecord2D.odds,  0)
-                    ), 0
-                ).label('win_amount')
+            q = (
+                db.session.query(
+                    model.agent_id.label('agent_id'),  # 这里就是“用户名”
+                    func.coalesce(func.sum(base_amount * market_count * func.coalesce(model.number_count, 1)), 0).label('sales')
+                )
+                .filter(model.status != 'delete', in_range)
+                .group_by(model.agent_id)
             )
-            .filter(
-                win_date_col >= start_date,
-                win_date_col <= end_date
+            if role != 'admin' and current_agent_name:
+                q = q.filter(model.agent_id == current_agent_name)
+            return q
+
+        def win_query(model, in_range):
+            # 中奖金额（含本金）
+            q = (
+                db.session.query(
+                    model.agent_id.label('agent_id'),  # 这里同样是“用户名”
+                    func.coalesce(
+                        func.sum(
+                            func.coalesce(model.stake, 0) *
+                            func.coalesce(model.odds,  0)
+                        ), 0
+                    ).label('win_amount')
+                )
+                .filter(in_range)
+                .group_by(model.agent_id)
             )
-            .group_by(WinningRecord2D.agent_id)
-        )
-        if role != 'admin' and current_agent_name:
-            win_q = win_q.filter(WinningRecord2D.agent_id == current_agent_name)
-        wins_by_agent = {row.agent_id: Decimal(row.win_amount or 0) for row in win_q.all()}
+            if role != 'admin' and current_agent_name:
+                q = q.filter(model.agent_id == current_agent_name)
+            return q
+
+        sales_qs = [sales_query(Bet2D, code_in_days(Bet2D.code, start_date, end_date))]
+        win_qs = [win_query(WinningRecord2D, code_in_days(WinningRecord2D.code, start_date, end_date))]
+        if has_archived_days(start_date, end_date):
+            sales_qs.append(sales_query(Bet2DArchive, and_(Bet2DArchive.day >= start_date, Bet2DArchive.day <= end_date)))
+            win_qs.append(win_query(WinningRecord2DArchive, and_(WinningRecord2DArchive.day >= start_date,
+                                                                 WinningRecord2DArchive.day <= end_date)))
+
+        # 按市场拆库时对每个库执行同样的查询后合并
+        sales_by_agent, wins_by_agent = {}, {}
+        for sess in shards_2d.all_sessions():
+            for q in sales_qs:
+                for row in q.with_session(sess).all():
+                    sales_by_agent[row.agent_id] = sales_by_agent.get(row.agent_id, Decimal('0')) + Decimal(row.sales or 0)
+            for q in win_qs:
+                for row in q.with_session(sess).all():
+                    wins_by_agent[row.agent_id] = wins_by_agent.get(row.agent_id, Decimal('0')) + Decimal(row.win_amount or 0)
 
         # 参与统计的代理名集合（都是用户名字符串）
         agent_keys = sorted(set(sales_by_agent.keys()) | set(wins_by_agent.keys()))
@@ -461,6 +612,52 @@ def create_app() -> Flask:
             flash(f"删除失败：{e}", "error")
         return redirect(url_for("agents_admin"))
 
+    # -------------- 采样分析（管理员） --------------
+    @app.route("/admin/profiles", methods=["GET", "POST"])
+    @admin_required
+    def profiles_admin():
+        route_targets = sorted({r.endpoint for r in app.url_map.iter_rules()
+                                if r.endpoint != "static" and not r.endpoint.startswith("profile")})
+        job_targets = [profiler_2d.SCHEDULER_PREFIX + j for j in profiler_2d.SCHEDULER_JOBS]
+
+        if request.method == "POST":
+            target = (request.form.get("target") or "").strip()
+            try:
+                count = int(request.form.get("count") or "0")
+            except ValueError:
+                count = 0
+            if target not in route_targets and target not in job_targets:
+                flash("未知的目标", "error")
+            else:
+                profiler_2d.arm(target, min(max(count, 0), 100))
+                flash(f"已预约 {target} × {count}" if count > 0 else f"已取消 {target}", "ok")
+            return redirect(url_for("profiles_admin"))
+
+        return render_template(
+            "profiles.html",
+            route_targets=route_targets,
+            job_targets=job_targets,
+            armed=profiler_2d.armed_targets(),
+            profiles=profiler_2d.list_profiles(),
+        )
+
+    @app.get("/admin/profiles/<name>")
+    @admin_required
+    def profile_download(name):
+        path = profiler_2d.profile_path(name)
+        if not path:
+            abort(404)
+        return send_file(path, mimetype="text/plain", as_attachment=True, download_name=name)
+
+    @app.post("/admin/profiles/<name>/delete")
+    @admin_required
+    def profile_delete(name):
+        path = profiler_2d.profile_path(name)
+        if path:
+            os.remove(path)
+            flash("已删除", "ok")
+        return redirect(url_for("profiles_admin"))
+
     # -------------- 下注页 --------------
     @app.route("/2d/bet", methods=["GET", "POST"])
     @login_required
@@ -502,6 +699,7 @@ def create_app() -> Flask:
                 form_date = date_str
 
             created = 0
+            pending: list[dict] = []
             slots_today = list_slots_for_day(day)
 
             def to_amt(name: str, i: int) -> Decimal:
@@ -513,13 +711,19 @@ def create_app() -> Flask:
                     return Decimal("0.00")
 
             for i in range(1, 13):
+                # 号码：两位数字，或多号码表达式（00-49 / 单 / 尾7 ...）存成一行掩码注单
                 raw_num = (request.form.get(f"number{i}") or "").strip()
-                if not raw_num.isdigit():
+                try:
+                    mask = number_mask_2d.parse(raw_num)
+                except ValueError:
                     continue
-                vi = int(raw_num)
-                if vi < 0 or vi > 99:
+                n_count = number_mask_2d.count(mask)
+                if n_count == 0:
                     continue
-                number = f"{vi:02d}"
+                if n_count == 1:
+                    number, number_mask = number_mask_2d.numbers(mask)[0], None
+                else:
+                    number, number_mask = number_mask_2d.MASK_NUMBER, number_mask_2d.to_hex(mask)
 
                 n1 = to_amt("N1", i)
                 n  = to_amt("N",  i)
@@ -552,23 +756,34 @@ def create_app() -> Flask:
                     order_code = ts.strftime("%y%m%d/%H%M%S") + f"{int(ts.microsecond/1000):03d}"
                     lock_at = parse_code_to_hour(code).replace(minute=49, second=0, microsecond=0)
 
-                    db.session.add(Bet2D(
+                    pending.append(dict(
                         order_code=order_code,
                         agent_id=agent_name,       # ⭐ 直接保存“用户名”
                         market=market_str,
                         code=code,
                         number=number,
+                        number_mask=number_mask,
+                        number_count=n_count,
                         amount_n1=n1, amount_n=n,
                         amount_b=bg, amount_s=sm,
                         amount_ds=od, amount_ss=ev,
                         status="active",
                         locked_at=lock_at
                     ))
-                    created += 1
 
             try:
-                if created > 0:
+                writer = app.extensions.get("bet_writer")
+                if pending and shards_2d.enabled():
+                    # 按市场拆库：拆行后逐库提交
+                    created = shards_2d.write_bets(pending)
+                elif pending and writer:
+                    # 组提交：与并发请求合并成一个事务，返回本请求实际入库条数
+                    created = writer.write(pending)
+                elif pending:
+                    db.session.add_all([Bet2D(**r) for r in pending])
                     db.session.commit()
+                    created = len(pending)
+                if created > 0:
                     flash(f"已提交 {created} 条注单。", "ok")
                     # 成功后回到本页；管理员保留 agent 选择
                     if g.role == "admin":
@@ -608,20 +823,33 @@ def create_app() -> Flask:
             start_date = end_date = date.today()
             start_date_str = end_date_str = today
 
-        code_date = func.to_date(func.substr(Bet2D.code, 1, 8), 'YYYYMMDD')
-
         q = (
             db.session.query(Bet2D)
             .filter(Bet2D.status != 'delete',
-                    code_date >= start_date,
-                    code_date <= end_date,
-        ))
+                    code_in_days(Bet2D.code, start_date, end_date))
+        )
 
         # 非管理员只看自己的：
         if session.get('role') != 'admin':
             q = q.filter(Bet2D.agent_id == session.get('username'))
 
-        rows = q.order_by(Bet2D.order_code.asc(), Bet2D.id.asc()).all()
+        queries = [q.order_by(Bet2D.order_code.asc(), Bet2D.id.asc())]
+
+        # 范围内有已归档日期时，合并归档表（归档行都已锁注）
+        if has_archived_days(start_date, end_date):
+            aq = Bet2DArchive.query.filter(Bet2DArchive.day >= start_date,
+                                           Bet2DArchive.day <= end_date)
+            if session.get('role') != 'admin':
+                aq = aq.filter(Bet2DArchive.agent_id == session.get('username'))
+            queries.append(aq)
+
+        # 按市场拆库时扇出到各库再合并
+        # 各库 id 独立编号，合并排序按 (订单号, 库名, id)，不同库的同号 id 不会互相覆盖或交错
+        sessions = shards_2d.named_sessions()
+        tagged = [(name, r) for name, sess in sessions for bq in queries for r in bq.with_session(sess).all()]
+        if len(queries) > 1 or len(sessions) > 1:
+            tagged.sort(key=lambda t: (t[1].order_code or '', t[0], t[1].id))
+        rows = [r for _, r in tagged]
 
         now_ts = datetime.now(MY_TZ).isoformat()
 
@@ -630,7 +858,8 @@ def create_app() -> Flask:
             "agent_id":   r.agent_id,
             "market":     r.market,
             "code":       r.code,
-            "number":     r.number,
+            "number":     number_mask_2d.bet_label(r),   # 多号码注单显示简写，如 00-49 / 单 / 尾7
+            "count":      r.number_count or 1,
             "amount_n1":  float(r.amount_n1 or 0),
             "amount_n":   float(r.amount_n  or 0),
             "amount_b":   float(r.amount_b  or 0),
@@ -657,30 +886,68 @@ def create_app() -> Flask:
         if not order_code:
             return {"ok": False, "error": "缺少 order_code"}, 400
 
-        q = Bet2D.query.filter(
-            Bet2D.order_code == order_code,
-            Bet2D.status != "delete"
-        )
         # 代理只能删自己的（按用户名）
-        if g.role == "agent" and g.username:
-            q = q.filter(Bet2D.agent_id == g.username)
-
-        rows = q.all()
-        if not rows:
-            return {"ok": False, "error": "未找到该订单或无权限"}, 404
-
-        now = datetime.now(MY_TZ)
-        if any(r.locked_at and now >= r.locked_at for r in rows):
-            return {"ok": False, "error": "订单已锁注，不能删除"}, 400
+        agent_name = g.username if g.role == "agent" and g.username else None
+        try:
+            res = cancel_orders([order_code], agent_name)[order_code]
+        except Exception as e:
+            return {"ok": False, "error": str(e)}, 500
+        if res["ok"]:
+            return res
+        return {"ok": False, "error": res["error"]}, (400 if res["locked"] else 404)
 
+    @app.post("/2d/history/delete_bulk")
+    @login_required
+    def history_2d_delete_bulk():
+        """批量撤单：JSON {"order_codes": [...]} 或表单多值 order_code；逐单返回结果"""
+        data = request.get_json(silent=True) or {}
+        codes = data.get("order_codes") or request.form.getlist("order_code")
+        if not isinstance(codes, list) or not codes:
+            return {"ok": False, "error": "缺少 order_codes"}, 400
+        codes = [str(c) for c in codes]
+        if len(codes) > MAX_CANCEL_ORDERS:
+            return {"ok": False, "error": f"一次最多 {MAX_CANCEL_ORDERS} 单"}, 400
+
+        agent_name = g.username if g.role == "agent" and g.username else None
         try:
-            for r in rows:
-                r.status = "delete"
-            db.session.commit()
-            return {"ok": True, "count": len(rows)}
+            results = cancel_orders(codes, agent_name)
         except Exception as e:
-            db.session.rollback()
             return {"ok": False, "error": str(e)}, 500
+        return {
+            "ok": True,
+            "deleted": sum(1 for r in results.values() if r["ok"]),
+            "results": results,
+        }
+
+    # -------------- 开奖冷热统计 --------------
+    def _stats_args():
+        market = request.args.get("market") or MARKETS[0]
+        if market not in MARKETS:
+            market = MARKETS[0]
+        try:
+            window = int(request.args.get("window") or draw_stats_2d.STAT_WINDOWS[0])
+        except ValueError:
+            window = draw_stats_2d.STAT_WINDOWS[0]
+        if window not in draw_stats_2d.STAT_WINDOWS:
+            window = draw_stats_2d.STAT_WINDOWS[0]
+        return market, window
+
+    @app.get("/2d/stats")
+    @login_required
+    def stats_2d_view():
+        market, window = _stats_args()
+        return render_template(
+            "stats_2d.html",
+            stats=draw_stats_2d.get_stats(db.session, market, window),
+            markets=MARKETS,
+            windows=draw_stats_2d.STAT_WINDOWS,
+        )
+
+    @app.get("/2d/stats.json")
+    @login_required
+    def stats_2d_json():
+        market, window = _stats_args()
+        return draw_stats_2d.get_stats(db.session, market, window)
 
     # -------------- 查看中奖（半自动结算） --------------
     @app.get("/2d/winning")
@@ -704,16 +971,53 @@ def create_app() -> Flask:
             db.session.rollback()
             flash(f"计算中奖时出错：{e}", "error")
 
-        # 3) 查询并展示（当天全部期号）
-        prefix = the_day.strftime("%Y%m%d")
-        records = (
-            WinningRecord2D.query
-            .filter(WinningRecord2D.code.like(f"{prefix}/%"))
-            .order_by(WinningRecord2D.code.desc(), WinningRecord2D.market.asc(), WinningRecord2D.id.asc())
-            .all()
+        # 3) 先读汇总（每天·代理 / 每期·市场·代理）；代理只看自己的
+        agent_name = g.username if g.role == "agent" and g.username else None
+        day_q = WinningDaySummary2D.query.filter(WinningDaySummary2D.day == the_day)
+        code_q = WinningSummary2D.query.filter(WinningSummary2D.day == the_day)
+        if agent_name:
+            day_q = day_q.filter(WinningDaySummary2D.agent_id == agent_name)
+            code_q = code_q.filter(WinningSummary2D.agent_id == agent_name)
+        sessions = shards_2d.all_sessions()
+        # 没有补算标记的日期（早于汇总功能、汇总失败过）提示“补算中”，而不是“暂无记录”
+        has_draws = db.session.query(DrawResult.query.filter(
+            DrawResult.code.like(the_day.strftime("%Y%m%d") + "/%")).exists()).scalar()
+        summary_pending = has_draws and any(sess.get(SummarizedDay2D, the_day) is None for sess in sessions)
+        day_rows = win_summary_2d.merge_rows(
+            (r for sess in sessions for r in day_q.with_session(sess).all()),
+            key=lambda r: r.agent_id)
+        day_rows.sort(key=lambda r: r["agent_id"])
+        code_rows = win_summary_2d.merge_rows(
+            (r for sess in sessions for r in code_q.with_session(sess).all()),
+            key=lambda r: (r.code, r.market, r.agent_id))
+        code_rows.sort(key=lambda r: (r["market"], r["agent_id"]))
+        code_rows.sort(key=lambda r: r["code"], reverse=True)
+        total_return = sum(r["total_return"] for r in day_rows)
+
+        # 4) 明细只在点开某一行时加载（已归档的日期从归档表读）
+        detail = None
+        d_code, d_market = request.args.get("code"), request.args.get("market")
+        d_agent = agent_name or request.args.get("agent")
+        if d_code and d_market and d_agent and d_code.startswith(the_day.strftime("%Y%m%d") + "/"):
+            queries = [WinningRecord2D.query.filter_by(code=d_code, market=d_market, agent_id=d_agent)]
+            if has_archived_days(the_day, the_day):
+                queries.append(WinningRecord2DArchive.query.filter_by(code=d_code, market=d_market, agent_id=d_agent))
+            tagged = [(name, r) for name, sess in shards_2d.named_sessions()
+                      for q in queries for r in q.with_session(sess).all()]
+            tagged.sort(key=lambda t: (t[0], t[1].id))
+            detail = [r for _, r in tagged]
+
+        return render_template(
+            "winning_2d.html",
+            date=date_str,
+            day_rows=day_rows,
+            code_rows=code_rows,
+            total_return=total_return,
+            hit_columns=win_summary_2d.HIT_COLUMNS,
+            detail=detail,
+            detail_key=(d_code, d_market, d_agent),
+            summary_pending=summary_pending,
         )
-        total_return = sum((r.stake or 0) + (r.payout or 0) for r in records)
-        return render_template("winning_2d.html", records=records, date=date_str, total_return=total_return)
 
     return app
 
@@ -0,0 +1,180 @@
+"""
+冷热分层：把超过保留期（ARCHIVE_HORIZON_DAYS，默认 35 天）的已结算日期整天搬出在线表。
+
+- bets_2d 中 status != 'delete' 的行 -> bets_2d_archive（带 day 列，按天索引）
+- winning_record_2d 当天的行       -> winning_record_2d_archive
+- 当天 status = 'delete' 的软删行直接清理，不再保留
+- 每搬完一天写一行 archived_days_2d，读路径（历史/中奖/财务）据此决定是否合并归档表
+
+一天的搬运在同一事务内完成；重复执行安全（在线表里已没有该天的行）。
+中奖记录按现状归档，归档前不再触发结算；因此只归档已结算的日期：当天每个开奖期号在各库都有
+结算页引擎的结算标记（settled_code_2d, engine='web'；多市场注单只由结算页结算）。未结算的日期跳过，
+打开 /2d/winning?date=YYYY-MM-DD 结算后，下一次归档会带上它（--dry-run 会列出这些日期）。
+按市场拆库时各库的注单就地归档到该库的归档表，清单仍记在默认库。默认库（含清单）先提交、分库后提交：
+某个分库提交失败时该库的行仍在在线表，读路径照常能查到，下次归档会把它补搬（清单计数累加）。
+
+    python archive_2d.py --init          # 建归档相关表（只建缺失的表；应用启动时也会自动执行）
+    python archive_2d.py [--horizon 35] [--dry-run]
+"""
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, insert, inspect, literal, select
+
+from models import (
+    db, Bet2D, WinningRecord2D, Bet2DArchive, WinningRecord2DArchive, ArchivedDay2D,
+    DrawResult, SettledCode2D,
+)
+from shards_2d import all_sessions
+
+MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
+ARCHIVE_HORIZON_DAYS = int(os.environ.get("ARCHIVE_HORIZON_DAYS", "35"))
+
+_BET_COLS = ["id", "order_code", "agent_id", "market", "code", "number", "number_mask", "number_count",
+             "amount_n1", "amount_n", "amount_b", "amount_s", "amount_ds", "amount_ss",
+             "status", "created_at", "locked_at"]
+_WIN_COLS = ["id", "bet_id", "agent_id", "market", "code", "number",
+             "hit_type", "stake", "odds", "payout", "created_at"]
+
+
+# ---------- 读路径 ----------
+_manifest_ready = False
+
+
+def _has_manifest() -> bool:
+    """archived_days_2d 是否已建（未建表时读路径按“没有归档”处理，不报错）"""
+    global _manifest_ready
+    if not _manifest_ready:
+        _manifest_ready = inspect(db.engine).has_table(ArchivedDay2D.__tablename__)
+    return _manifest_ready
+
+
+def has_archived_days(start: date, end: date) -> bool:
+    """[start, end] 内是否有已归档的日期（主键范围查询，开销可忽略）"""
+    if not _has_manifest():
+        return False
+    return db.session.query(
+        db.session.query(ArchivedDay2D.day)
+        .filter(ArchivedDay2D.day >= start, ArchivedDay2D.day <= end)
+        .exists()
+    ).scalar()
+
+
+# ---------- 写路径 ----------
+def candidate_days(horizon_days: int | None = None, today: date | None = None) -> list[date]:
+    """在线表中早于 today - horizon 的日期（按开奖 code 的日期），不论是否已结算"""
+    horizon_days = ARCHIVE_HORIZON_DAYS if horizon_days is None else horizon_days
+    today = today or datetime.now(MY_TZ).date()
+    cutoff = (today - timedelta(days=horizon_days)).strftime("%Y%m%d")
+
+    day_col = func.substr(Bet2D.code, 1, 8)
+    days = set()
+    for sess in all_sessions():
+        rows = (sess.query(day_col)
+                .filter(Bet2D.code < cutoff)   # 'YYYYMMDD/HHMM' < 'YYYYMMDD' 即更早的日期
+                .distinct()
+                .all())
+        for (s,) in rows:
+            try:
+                days.add(datetime.strptime(s, "%Y%m%d").date())
+            except (TypeError, ValueError):
+                continue
+    return sorted(days)
+
+
+def is_settled(day: date) -> bool:
+    """当天每个开奖期号在各库都有结算页引擎的结算标记"""
+    prefix = day.strftime("%Y%m%d") + "/%"
+    codes = {c for (c,) in db.session.query(DrawResult.code).filter(DrawResult.code.like(prefix)).distinct()}
+    for sess in all_sessions():
+        settled = {c for (c,) in sess.query(SettledCode2D.code)
+                   .filter(SettledCode2D.engine == "web", SettledCode2D.code.like(prefix))}
+        if codes - settled:
+            return False
+    return True
+
+
+def days_to_archive(horizon_days: int | None = None, today: date | None = None) -> tuple[list[date], list[date]]:
+    """(可归档的日期, 超过保留期但尚未结算、本次跳过的日期)"""
+    days = candidate_days(horizon_days, today)
+    ready = [d for d in days if is_settled(d)]
+    return ready, [d for d in days if d not in ready]
+
+
+def archive_day(day: date) -> dict:
+    """把一天从在线表原样搬到归档表（不重新结算），返回 {day, bets, wins, purged}"""
+    prefix = day.strftime("%Y%m%d") + "/%"
+    sessions = all_sessions()
+    bets = wins = purged = 0
+    try:
+        for sess in sessions:
+            n_bets = sess.execute(
+                insert(Bet2DArchive).from_select(
+                    ["day"] + _BET_COLS,
+                    select(literal(day), *[getattr(Bet2D, c) for c in _BET_COLS])
+                    .where(Bet2D.code.like(prefix), Bet2D.status != "delete")
+                )
+            ).rowcount
+            wins += sess.execute(
+                insert(WinningRecord2DArchive).from_select(
+                    ["day"] + _WIN_COLS,
+                    select(literal(day), *[getattr(WinningRecord2D, c) for c in _WIN_COLS])
+                    .where(WinningRecord2D.code.like(prefix))
+                )
+            ).rowcount
+
+            sess.query(WinningRecord2D).filter(WinningRecord2D.code.like(prefix)).delete(synchronize_session=False)
+            removed = sess.query(Bet2D).filter(Bet2D.code.like(prefix)).delete(synchronize_session=False)
+            bets += n_bets
+            purged += removed - n_bets
+
+        rec = db.session.get(ArchivedDay2D, day)
+        if rec is None:
+            rec = ArchivedDay2D(day=day, bets=0, wins=0, purged=0)
+            db.session.add(rec)
+        rec.bets += bets
+        rec.wins += wins
+        rec.purged += purged
+        for sess in sessions:   # 默认库（含清单）先提交，分库后提交；见模块说明
+            sess.commit()
+    except Exception:
+        for sess in sessions:
+            sess.rollback()
+        raise
+    return {"day": day, "bets": bets, "wins": wins, "purged": purged}
+
+
+def run_archive(horizon_days: int | None = None, today: date | None = None) -> list[dict]:
+    """逐天归档，一天一个事务；某天失败不影响已完成的天。未结算的日期跳过"""
+    ready, _ = days_to_archive(horizon_days, today)
+    return [archive_day(d) for d in ready]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="2D 冷数据归档")
+    ap.add_argument("--horizon", type=int, default=ARCHIVE_HORIZON_DAYS, help="在线表保留天数")
+    ap.add_argument("--init", action="store_true", help="创建缺失的归档表后退出")
+    ap.add_argument("--dry-run", action="store_true", help="只列出待归档日期")
+    args = ap.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.init:
+            db.create_all()
+            print("[archive] 表已就绪")
+            return
+        ready, unsettled = days_to_archive(args.horizon)
+        if unsettled:
+            print("[archive] 未结算，跳过：" + ", ".join(d.isoformat() for d in unsettled))
+        if args.dry_run:
+            print("[archive] 待归档：" + (", ".join(d.isoformat() for d in ready) or "无"))
+            return
+        for r in run_archive(args.horizon):
+            print(f"[archive] {r['day']} 注单={r['bets']} 中奖={r['wins']} 清理delete={r['purged']}")
+
+
+if __name__ == "__main__":
+    main()
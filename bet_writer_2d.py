@@ -0,0 +1,191 @@
+"""
+下注组提交（可选）：把并发请求里已校验好的注单合并成短批次，一个事务提交一次。
+
+开启：BET_WRITER=group
+  BET_WRITER_MAX_BATCH    每批最多合并的请求数（默认 64）
+  BET_WRITER_MAX_WAIT_MS  第一个请求到达后最多等待多久凑批（默认 5ms）
+
+每个请求在批内有自己的 SAVEPOINT：某个请求写入失败只回滚它自己，其余照常提交；
+最终 COMMIT 失败则整批请求都收到异常。入库前按 locked_at 再判一次锁注，
+凑批等待期间跨过 :49 的行会被丢弃，不会漏进已锁注的期号。
+等待超时只撤回仍在排队的请求；已在写的请求等提交结束，不会出现“报失败但已入库”。
+按市场拆库（BET_SHARDS）时下注改走 shards_2d.write_bets 逐库提交，不经过组提交。
+
+吞吐对比（同一本地库，逐请求提交 vs 组提交）：
+    python bet_writer_2d.py --threads 32 --requests 2000
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import shards_2d
+from models import db, Bet2D
+
+MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
+
+
+class GroupCommitWriter:
+    def __init__(self, app, max_batch: int = 64, max_wait: float = 0.005):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._q: queue.Queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # 延迟到第一次提交再起线程：gunicorn fork 之后每个 worker 各自一个
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="bet-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, rows: list[dict]) -> Future:
+        """rows 为 Bet2D 字段字典；Future 结果为实际入库条数"""
+        fut: Future = Future()
+        self._ensure_started()
+        self._q.put((rows, fut))
+        return fut
+
+    def write(self, rows: list[dict], timeout: float = 30) -> int:
+        """
+        等待入库结果。超时时若还在排队就撤回（保证不会入库，提示重试不会重复下注）；
+        已进入写批次的则等到提交结束，以真实结果为准。
+        """
+        fut = self.submit(rows)
+        try:
+            return fut.result(timeout)
+        except FutureTimeout:
+            if fut.cancel():
+                raise FutureTimeout("下注排队超时，未入库，请重试") from None
+            return fut.result()
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception as e:   # 兜底：不让写线程退出
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _flush(self, batch: list[tuple[list[dict], Future]]):
+        with self.app.app_context():
+            done: list[tuple[Future, int]] = []
+            try:
+                for rows, fut in batch:
+                    if not fut.set_running_or_notify_cancel():
+                        continue
+                    now = datetime.now(MY_TZ)
+                    keep = [r for r in rows if not (r.get("locked_at") and now >= r["locked_at"])]
+                    try:
+                        with db.session.begin_nested():
+                            db.session.add_all([Bet2D(**r) for r in keep])
+                        done.append((fut, len(keep)))
+                    except Exception as e:
+                        fut.set_exception(e)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception("组提交失败")
+                for fut, _ in done:
+                    fut.set_exception(e)
+                return
+        for fut, n in done:
+            fut.set_result(n)
+
+
+def init_bet_writer(app):
+    """BET_WRITER=group 时挂到 app.extensions['bet_writer']，否则保持逐请求提交"""
+    if os.environ.get("BET_WRITER", "").lower() != "group":
+        return None
+    writer = GroupCommitWriter(
+        app,
+        max_batch=int(os.environ.get("BET_WRITER_MAX_BATCH", "64")),
+        max_wait=float(os.environ.get("BET_WRITER_MAX_WAIT_MS", "5")) / 1000.0,
+    )
+    app.extensions["bet_writer"] = writer
+    if shards_2d.enabled():
+        app.logger.warning("已配置 BET_SHARDS：下注按市场逐库提交，BET_WRITER=group 不生效")
+    return writer
+
+
+# ---------- 吞吐对比 ----------
+BENCH_AGENT = "#bench"
+
+
+def _bench_rows(n: int) -> list[dict]:
+    # 明天 23:50 期：压测期间不会锁注
+    day = datetime.now(MY_TZ).date() + timedelta(days=1)
+    code = day.strftime("%Y%m%d") + "/2350"
+    lock_at = datetime(day.year, day.month, day.day, 23, 49, tzinfo=MY_TZ)
+    ts = datetime.now(MY_TZ).strftime("%y%m%d/%H%M%S000")
+    return [dict(order_code=ts, agent_id=BENCH_AGENT, market="MGV21", code=code,
+                 number=f"{i % 100:02d}", amount_n=1, status="active", locked_at=lock_at)
+            for i in range(n)]
+
+
+def _bench(app, mode: str, threads: int, requests: int, rows: int) -> float:
+    writer = GroupCommitWriter(app) if mode == "group" else None
+    per_thread = requests // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(per_thread):
+            batch = _bench_rows(rows)
+            if writer:
+                writer.write(batch)
+            else:
+                with app.app_context():
+                    db.session.add_all([Bet2D(**r) for r in batch])
+                    db.session.commit()
+
+    ts = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in ts:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    with app.app_context():
+        Bet2D.query.filter(Bet2D.agent_id == BENCH_AGENT).delete(synchronize_session=False)
+        db.session.commit()
+    return per_thread * threads / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="逐请求提交 vs 组提交 吞吐对比")
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--rows", type=int, default=4, help="每个请求的注单行数")
+    args = ap.parse_args()
+
+    from app import create_app
+    app = create_app()
+    for mode in ("direct", "group"):
+        rps = _bench(app, mode, args.threads, args.requests, args.rows)
+        print(f"{mode:<7} {rps:10.1f} 请求/秒  ({rps * args.rows:.0f} 行/秒)")
+
+
+if __name__ == "__main__":
+    main()
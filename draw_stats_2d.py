@@ -0,0 +1,306 @@
+"""
+开奖冷热统计：按市场维护最近 N 期（STAT_WINDOWS）的滚动计数，读取时只查预计算行。
+
+- 新开奖且期号晚于该市场 last_code：增量更新（+新一期，-每个窗口里被挤出的那一期，
+  连开与各号码遗漏值顺延），工作量与历史总量无关
+- 更正、补录旧期号、删除、或同一事务里同市场多期：按最近 max(STAT_WINDOWS) 期重建该市场
+- 通过 ORM 写入 DrawResult 时在同一事务内自动维护；库外直接写入的开奖由
+  sync_all()（调度独立任务）处理：先校验游标之前的窗口（发现库外更正/删除即重建），
+  再把游标之后的新期号逐期增量叠加
+"""
+from types import SimpleNamespace
+
+from sqlalchemy import event
+from flask_sqlalchemy.session import Session as FlaskSession
+
+from models import DrawResult, DrawNumberStat2D, DrawWindowStat2D, DrawMarketStat2D
+
+STAT_WINDOWS = (30, 100, 300)
+GAP_CAP = max(STAT_WINDOWS)          # 遗漏值在重建时最多回看这么多期
+NUMBERS = [f"{i:02d}" for i in range(100)]
+
+_PENDING_KEY = "draw_stats_2d_pending"
+
+
+def _specials(dr) -> list[str]:
+    return [x.strip() for x in (dr.specials or "").split(",") if x.strip()]
+
+
+def _size_parity(dr) -> tuple[str | None, str | None]:
+    """优先用开奖的 size_type/parity_type；缺失时按头奖推算（与调度验奖一致）"""
+    size, parity = dr.size_type, dr.parity_type
+    try:
+        h = int((dr.head or "").strip())
+    except ValueError:
+        h = -1
+    if size not in ("大", "小") and 0 <= h <= 99:
+        size = "大" if h >= 50 else "小"
+    if parity not in ("单", "双") and 0 <= h <= 99:
+        parity = "单" if h % 2 == 1 else "双"
+    return size, parity
+
+
+def _window_delta(ws: DrawWindowStat2D, dr, sign: int):
+    size, parity = _size_parity(dr)
+    ws.draws += sign
+    if size == "大":
+        ws.big += sign
+    elif size == "小":
+        ws.small += sign
+    if parity == "单":
+        ws.odd += sign
+    elif parity == "双":
+        ws.even += sign
+
+
+def _number_delta(session, market: str, window: int, dr, sign: int):
+    head = (dr.head or "").strip()
+    touched = {head: [1, 0]} if head in NUMBERS else {}
+    for sp in _specials(dr):
+        if sp in NUMBERS:
+            touched.setdefault(sp, [0, 0])[1] += 1
+    for num, (dh, ds) in touched.items():
+        row = session.get(DrawNumberStat2D, (market, window, num))
+        if row is None:
+            row = DrawNumberStat2D(market=market, window=window, number=num, head_hits=0, special_hits=0)
+            session.add(row)
+        row.head_hits += sign * dh
+        row.special_hits += sign * ds
+
+
+def _recent_draws(session, market: str, limit: int, offset: int = 0, upto: str | None = None):
+    """按期号倒序取该市场的开奖；upto 给定时只看不晚于该期号的"""
+    q = session.query(DrawResult).filter(DrawResult.market == market)
+    if upto is not None:
+        q = q.filter(DrawResult.code <= upto)
+    return q.order_by(DrawResult.code.desc()).offset(offset).limit(limit).all()
+
+
+# ---------- 增量 ----------
+def apply_new_draw(session, ms: DrawMarketStat2D, dr):
+    """dr 为晚于 ms.last_code 的下一期（已 flush）；库里更晚的期号不影响本次计算"""
+    market = dr.market
+    for w in STAT_WINDOWS:
+        ws = session.get(DrawWindowStat2D, (market, w))
+        if ws is None:
+            ws = DrawWindowStat2D(market=market, window=w, draws=0, big=0, small=0, odd=0, even=0)
+            session.add(ws)
+        _window_delta(ws, dr, +1)
+        _number_delta(session, market, w, dr, +1)
+        evicted = _recent_draws(session, market, 1, offset=w, upto=dr.code)
+        if evicted:
+            _window_delta(ws, evicted[0], -1)
+            _number_delta(session, market, w, evicted[0], -1)
+
+    size, parity = _size_parity(dr)
+    if size and size == ms.size_streak:
+        ms.size_streak_len += 1
+    else:
+        ms.size_streak, ms.size_streak_len = size, (1 if size else 0)
+    if parity and parity == ms.parity_streak:
+        ms.parity_streak_len += 1
+    else:
+        ms.parity_streak, ms.parity_streak_len = parity, (1 if parity else 0)
+
+    head = (dr.head or "").strip()
+    gaps = [int(x) for x in (ms.head_gaps or "").split(",")] if ms.head_gaps else [GAP_CAP] * 100
+    gaps = [0 if NUMBERS[i] == head else min(g + 1, GAP_CAP) for i, g in enumerate(gaps)]
+    ms.head_gaps = ",".join(map(str, gaps))
+    ms.last_code = dr.code
+
+
+# ---------- 全量快照（有界：只看最近 GAP_CAP 期），重建与校验共用 ----------
+def _snapshot(draws) -> dict:
+    """draws 为新 -> 旧的最近 GAP_CAP 期；返回与库中统计行同形的数据"""
+    windows, numbers = {}, {}
+    for w in STAT_WINDOWS:
+        ws = SimpleNamespace(draws=0, big=0, small=0, odd=0, even=0)
+        counts = {}
+        for dr in draws[:w]:
+            _window_delta(ws, dr, +1)
+            head = (dr.head or "").strip()
+            if head in NUMBERS:
+                counts.setdefault(head, [0, 0])[0] += 1
+            for sp in _specials(dr):
+                if sp in NUMBERS:
+                    counts.setdefault(sp, [0, 0])[1] += 1
+        windows[w] = vars(ws)
+        numbers[w] = {n: tuple(c) for n, c in counts.items()}
+
+    streaks = {}
+    for idx, attr in enumerate(("size", "parity")):
+        first = _size_parity(draws[0])[idx] if draws else None
+        n = 0
+        for dr in draws:
+            if first is None or _size_parity(dr)[idx] != first:
+                break
+            n += 1
+        streaks[attr] = (first, n)
+
+    gaps = [GAP_CAP] * 100
+    for i, dr in enumerate(draws):
+        head = (dr.head or "").strip()
+        if head in NUMBERS and gaps[int(head)] == GAP_CAP:
+            gaps[int(head)] = i
+    return {
+        "windows": windows,
+        "numbers": numbers,
+        "size_streak": streaks["size"],
+        "parity_streak": streaks["parity"],
+        "head_gaps": ",".join(map(str, gaps)),
+        "last_code": draws[0].code if draws else None,
+    }
+
+
+def _stored(session, market: str, ms: DrawMarketStat2D) -> dict:
+    """库中现有统计行，整理成 _snapshot 的形状（计数为 0 的号码行忽略）"""
+    windows = {w: None for w in STAT_WINDOWS}
+    for ws in session.query(DrawWindowStat2D).filter(DrawWindowStat2D.market == market):
+        windows[ws.window] = {k: getattr(ws, k) for k in ("draws", "big", "small", "odd", "even")}
+    numbers = {w: {} for w in STAT_WINDOWS}
+    for r in session.query(DrawNumberStat2D).filter(DrawNumberStat2D.market == market):
+        if r.window in numbers and (r.head_hits or r.special_hits):
+            numbers[r.window][r.number] = (r.head_hits, r.special_hits)
+    return {
+        "windows": windows,
+        "numbers": numbers,
+        "size_streak": (ms.size_streak, ms.size_streak_len),
+        "parity_streak": (ms.parity_streak, ms.parity_streak_len),
+        "head_gaps": ms.head_gaps,
+        "last_code": ms.last_code,
+    }
+
+
+def rebuild_market(session, market: str):
+    snap = _snapshot(_recent_draws(session, market, GAP_CAP))
+    session.query(DrawNumberStat2D).filter(DrawNumberStat2D.market == market).delete()
+    session.query(DrawWindowStat2D).filter(DrawWindowStat2D.market == market).delete()
+    for w in STAT_WINDOWS:
+        session.add(DrawWindowStat2D(market=market, window=w, **snap["windows"][w]))
+        session.add_all([
+            DrawNumberStat2D(market=market, window=w, number=n, head_hits=h, special_hits=sp)
+            for n, (h, sp) in snap["numbers"][w].items()
+        ])
+
+    ms = session.get(DrawMarketStat2D, market)
+    if ms is None:
+        ms = DrawMarketStat2D(market=market)
+        session.add(ms)
+    ms.size_streak, ms.size_streak_len = snap["size_streak"]
+    ms.parity_streak, ms.parity_streak_len = snap["parity_streak"]
+    ms.head_gaps = snap["head_gaps"]
+    ms.last_code = snap["last_code"]
+
+
+def on_draws_changed(session, changes: dict[str, list[tuple[str, str]]]):
+    """changes: {market: [(op, code), ...]}，op 为 insert/update/delete"""
+    for market, items in changes.items():
+        ms = session.get(DrawMarketStat2D, market)
+        if ms is not None and len(items) == 1 and items[0][0] == "insert":
+            code = items[0][1]
+            newest = _recent_draws(session, market, 1)
+            if ms.last_code and code > ms.last_code and newest and newest[0].code == code:
+                apply_new_draw(session, ms, newest[0])
+                continue
+        rebuild_market(session, market)
+
+
+def sync_all(session) -> list[str]:
+    """
+    库外写入的开奖（不经过 ORM 钩子）在这里追平：
+    - 先用游标之前最近 GAP_CAP 期重算快照，与库中统计比对；不一致说明有库外更正/删除/补录，重建
+    - 一致则把游标之后的新期号逐期增量叠加
+    返回有变化的市场
+    """
+    changed = []
+    for (market,) in session.query(DrawResult.market).distinct():
+        ms = session.get(DrawMarketStat2D, market)
+        if ms is None or not ms.last_code:
+            rebuild_market(session, market)
+            changed.append(market)
+            continue
+        if _snapshot(_recent_draws(session, market, GAP_CAP, upto=ms.last_code)) != _stored(session, market, ms):
+            rebuild_market(session, market)
+            changed.append(market)
+            continue
+        new = (session.query(DrawResult)
+               .filter(DrawResult.market == market, DrawResult.code > ms.last_code)
+               .order_by(DrawResult.code.asc())
+               .all())
+        for dr in new:
+            apply_new_draw(session, ms, dr)
+            session.flush()
+        if new:
+            changed.append(market)
+    return changed
+
+
+# ---------- 读取（常数时间） ----------
+def get_stats(session, market: str, window: int) -> dict:
+    ws = session.get(DrawWindowStat2D, (market, window))
+    ms = session.get(DrawMarketStat2D, market)
+    rows = {r.number: r for r in session.query(DrawNumberStat2D)
+            .filter(DrawNumberStat2D.market == market, DrawNumberStat2D.window == window)}
+    gaps = [int(x) for x in ms.head_gaps.split(",")] if ms and ms.head_gaps else [None] * 100
+    numbers = [{
+        "number": n,
+        "head_hits": rows[n].head_hits if n in rows else 0,
+        "special_hits": rows[n].special_hits if n in rows else 0,
+        "head_gap": gaps[i],
+    } for i, n in enumerate(NUMBERS)]
+    return {
+        "market": market,
+        "window": window,
+        "last_code": ms.last_code if ms else None,
+        "draws": ws.draws if ws else 0,
+        "big": ws.big if ws else 0,
+        "small": ws.small if ws else 0,
+        "odd": ws.odd if ws else 0,
+        "even": ws.even if ws else 0,
+        "size_streak": {"type": ms.size_streak if ms else None, "length": ms.size_streak_len if ms else 0},
+        "parity_streak": {"type": ms.parity_streak if ms else None, "length": ms.parity_streak_len if ms else 0},
+        "gap_cap": GAP_CAP,
+        "numbers": numbers,
+    }
+
+
+# ---------- ORM 钩子：同一事务内维护 ----------
+# 只挂在 Flask-SQLAlchemy 的会话类上（开奖只在默认库）；分库会话、独立 sessionmaker 不经过这里。
+# 事务里没有 DrawResult 变动时两个钩子都直接返回，不额外 flush。
+def _draw_objects(objs):
+    return [o for o in objs if isinstance(o, DrawResult)]
+
+
+@event.listens_for(FlaskSession, "after_flush")
+def _collect_draw_changes(session, flush_context):
+    if session.info.get("_draw_stats_busy"):
+        return
+    for op, objs in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in _draw_objects(objs):
+            if op == "update" and not session.is_modified(obj):
+                continue
+            session.info.setdefault(_PENDING_KEY, {}).setdefault(obj.market, []).append((op, obj.code))
+
+
+@event.listens_for(FlaskSession, "before_commit")
+def _apply_draw_changes(session):
+    if session.info.get("_draw_stats_busy"):
+        return
+    if not any(_draw_objects(objs) for objs in (session.new, session.dirty, session.deleted)) \
+            and _PENDING_KEY not in session.info:
+        return
+    session.flush()   # before_commit 先于最后一次 flush；先 flush 才能收集到本事务的开奖
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    session.info["_draw_stats_busy"] = True
+    try:
+        on_draws_changed(session, pending)
+        session.flush()
+    finally:
+        session.info.pop("_draw_stats_busy", None)
+
+
+@event.listens_for(FlaskSession, "after_rollback")
+def _drop_draw_changes(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,300 @@
+"""
+截止前压测：模拟大量代理在 :49 锁注前一分钟并发下注 / 删单。
+
+只用标准库发请求（每个虚拟代理一个 cookie 会话），针对本地启动的 app + 本地数据库：
+    python loadtest_2d.py --setup --agents 200            # 先在本地库建压测代理
+    python loadtest_2d.py --agents 200 --wait-cutoff --sweep
+
+--wait-cutoff：等到当前小时 :48:00 开始，默认压 90 秒（跨过 :49）
+--sweep：在 :49:00 于本进程内执行一次 job_lock_bets_2d（与调度器同一逻辑），
+         压测结束后统计该期“锁注之后仍为 active / 晚于锁注入库”的注单数。
+--setup / --sweep 需要与 app 相同的 DATABASE_URL。
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+from zoneinfo import ZoneInfo
+
+MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
+MARKETS = ["MGV21", "UCA68", "SFC99"]
+AGENT_PREFIX = "lt"
+
+_ROWS_RE = re.compile(r'<script id="rowsData" type="application/json">(.*?)</script>', re.S)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # 只计 POST 本身的耗时，不跟随 302
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)   # endpoint -> [ms]
+        self.errors = defaultdict(int)     # endpoint -> 次数
+        self.accepted = 0                  # 成功下注的请求数
+        self.rejected = 0                  # 被判定“无有效行/已锁注”的请求数
+
+    def record(self, endpoint: str, ms: float, ok: bool):
+        with self.lock:
+            self.latency[endpoint].append(ms)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+def percentile(values: list[float], p: float) -> float:
+    """最近秩百分位"""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, math.ceil(p / 100.0 * len(s)) - 1))
+    return s[k]
+
+
+def agent_names(n: int) -> list[str]:
+    return [f"{AGENT_PREFIX}{i:03d}" for i in range(1, n + 1)]
+
+
+def setup_agents(n: int, password: str):
+    """在本地库里创建压测代理（已存在则跳过）"""
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from models import db, Agent
+
+    app = create_app()
+    with app.app_context():
+        pw_hash = generate_password_hash(password, method="pbkdf2:sha256")
+        existing = {a.username for a in Agent.query.filter(Agent.username.like(f"{AGENT_PREFIX}%")).all()}
+        created = 0
+        for name in agent_names(n):
+            if name in existing:
+                continue
+            db.session.add(Agent(username=name, password_hash=pw_hash, is_active=True))
+            created += 1
+        db.session.commit()
+        print(f"[setup] 新建代理 {created} 个（共 {n} 个）")
+
+
+def build_bet_form(day_str: str, slot_idx: int, rows: int) -> dict:
+    """仿照 bet_2d.html 的表单字段：number{i} / N1{i} ... / slot{i}_{idx} / market{i}_{m}"""
+    form = {"date": day_str}
+    for i in range(1, rows + 1):
+        form[f"number{i}"] = f"{random.randint(0, 99):02d}"
+        form[f"N1{i}"] = str(random.choice([0, 1, 2, 5]))
+        form[f"N{i}"] = str(random.choice([1, 2, 5, 10]))
+        if random.random() < 0.3:
+            form[f"BIG{i}"] = "1"
+        if random.random() < 0.3:
+            form[f"ODD{i}"] = "1"
+        form[f"slot{i}_{slot_idx}"] = "on"
+        for m in random.sample(MARKETS, random.randint(1, len(MARKETS))):
+            form[f"market{i}_{m}"] = "on"
+    return form
+
+
+class VirtualAgent(threading.Thread):
+    def __init__(self, base_url, username, password, day_str, slot_idx, args, stats, stop_at):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.day_str = day_str
+        self.slot_idx = slot_idx
+        self.args = args
+        self.stats = stats
+        self.stop_at = stop_at
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect()
+        )
+
+    def _call(self, endpoint: str, path: str, data: dict | None = None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        t0 = time.perf_counter()
+        try:
+            resp = self.opener.open(self.base_url + path, data=body, timeout=self.args.timeout)
+            status, headers, text = resp.status, resp.headers, resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            status, headers, text = e.code, e.headers, e.read().decode("utf-8", "replace")
+        except Exception:
+            self.stats.record(endpoint, (time.perf_counter() - t0) * 1000, False)
+            return None, None, None, None
+        ms = (time.perf_counter() - t0) * 1000
+        return status, headers, text, ms
+
+    def login(self) -> bool:
+        r = self._call("login", "/login", {"username": self.username, "password": self.password})
+        if r[0] is None:
+            return False
+        status, headers, _, ms = r
+        ok = status == 302 and "/login" not in (headers.get("Location") or "")
+        self.stats.record("login", ms, ok)
+        return ok
+
+    def place_bet(self):
+        form = build_bet_form(self.day_str, self.slot_idx, self.args.rows)
+        r = self._call("bet", f"/2d/bet?date={self.day_str}", form)
+        if r[0] is None:
+            return
+        status, headers, _, ms = r
+        ok = status == 302
+        self.stats.record("bet", ms, ok)
+        if ok:
+            with self.stats.lock:
+                if "success=1" in (headers.get("Location") or ""):
+                    self.stats.accepted += 1
+                else:
+                    self.stats.rejected += 1
+
+    def delete_one(self):
+        # 与真实代理一样：先打开下注记录，再删其中一单
+        r = self._call("history", f"/2d/history?start_date={self.day_str}&end_date={self.day_str}")
+        if r[0] is None:
+            return
+        status, _, text, ms = r
+        self.stats.record("history", ms, status == 200)
+        m = _ROWS_RE.search(text or "")
+        if status != 200 or not m:
+            return
+        try:
+            codes = sorted({row["order_code"] for row in json.loads(m.group(1))})
+        except (ValueError, KeyError, TypeError):
+            return
+        if not codes:
+            return
+        r = self._call("delete", "/2d/history/delete", {"order_code": random.choice(codes)})
+        if r[0] is None:
+            return
+        status, _, _, ms = r
+        # 400（已锁注）属于业务拒绝，不计错误
+        self.stats.record("delete", ms, status in (200, 400, 404))
+
+    def run(self):
+        if not self.login():
+            return
+        while time.time() < self.stop_at:
+            if random.random() < self.args.delete_ratio:
+                self.delete_one()
+            else:
+                self.place_bet()
+            time.sleep(random.uniform(0, self.args.think))
+
+
+def sweep_at(target: datetime, result: dict):
+    """到点执行一次锁注（复用调度器的 job_lock_bets_2d）"""
+    from run_scheduler_2d import job_lock_bets_2d   # 先导入，避免建 app 的耗时落在 :49 之后
+    delay = (target - datetime.now(MY_TZ)).total_seconds()
+    if delay > 0:
+        time.sleep(delay)
+    code, swept_at, rows = job_lock_bets_2d()
+    result.update(code=code, swept_at=swept_at, rows=rows)
+
+
+def count_leaked(slot_code: str, swept_at: datetime) -> tuple[int, int]:
+    """锁注后该期仍为 active 的注单数、晚于锁注时间入库的注单数（仅压测代理）"""
+    from app import create_app
+    from models import Bet2D
+    from shards_2d import all_sessions
+
+    app = create_app()
+    with app.app_context():
+        still_active = after_sweep = 0
+        for sess in all_sessions():
+            base = sess.query(Bet2D).filter(Bet2D.code == slot_code,
+                                            Bet2D.agent_id.like(f"{AGENT_PREFIX}%"))
+            still_active += base.filter(Bet2D.status == "active").count()
+            after_sweep += base.filter(Bet2D.status != "delete", Bet2D.created_at > swept_at).count()
+        return still_active, after_sweep
+
+
+def main():
+    ap = argparse.ArgumentParser(description="2D 截止前下注压测")
+    ap.add_argument("--base-url", default="http://127.0.0.1:5000")
+    ap.add_argument("--agents", type=int, default=100, help="并发虚拟代理数")
+    ap.add_argument("--password", default="loadtest123")
+    ap.add_argument("--duration", type=float, default=90, help="压测秒数")
+    ap.add_argument("--rows", type=int, default=4, help="每次下注的行数（1-12）")
+    ap.add_argument("--delete-ratio", type=float, default=0.1, help="删单动作占比")
+    ap.add_argument("--think", type=float, default=0.5, help="两次动作间最大随机间隔（秒）")
+    ap.add_argument("--timeout", type=float, default=30)
+    ap.add_argument("--setup", action="store_true", help="只在本地库创建压测代理后退出")
+    ap.add_argument("--wait-cutoff", action="store_true", help="等到本小时 :48:00 再开始")
+    ap.add_argument("--sweep", action="store_true", help="在 :49:00 执行锁注并统计漏锁注单")
+    args = ap.parse_args()
+    args.rows = max(1, min(12, args.rows))
+
+    if args.setup:
+        setup_agents(args.agents, args.password)
+        return
+
+    now = datetime.now(MY_TZ)
+    if not (9 <= now.hour <= 23) or now.minute >= 49:
+        if args.wait_cutoff or args.sweep:
+            raise SystemExit("当前时间不在 HH:00–HH:48（09–23 点）内，无法对准本期锁注")
+    if args.wait_cutoff:
+        start = now.replace(minute=48, second=0, microsecond=0)
+        if start > now:
+            print(f"等待至 {start:%H:%M:%S} 开始 …")
+            time.sleep((start - now).total_seconds())
+
+    now = datetime.now(MY_TZ)
+    lock_time = now.replace(minute=49, second=0, microsecond=0)
+    day_str = now.strftime("%Y-%m-%d")
+    slot_idx = min(max(now.hour - 9, 0), 14)
+    slot_code = now.strftime("%Y%m%d") + f"/{now.hour:02d}50"
+
+    stats = Stats()
+    stop_at = time.time() + args.duration
+    workers = [
+        VirtualAgent(args.base_url, name, args.password, day_str, slot_idx, args, stats, stop_at)
+        for name in agent_names(args.agents)
+    ]
+
+    sweep_result: dict = {}
+    sweeper = None
+    if args.sweep:
+        if lock_time > now + timedelta(seconds=args.duration):
+            print("提示：锁注时间不在压测窗口内，本次不执行锁注")
+        else:
+            sweeper = threading.Thread(target=sweep_at, args=(lock_time, sweep_result), daemon=True)
+            sweeper.start()
+
+    print(f"开始：{len(workers)} 个代理，目标期号 {slot_code}，持续 {args.duration:.0f}s")
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    if sweeper:
+        sweeper.join()
+    elapsed = time.perf_counter() - t0
+
+    print(f"\n耗时 {elapsed:.1f}s")
+    print(f"{'endpoint':<10}{'n':>8}{'err%':>8}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for ep in ("login", "bet", "history", "delete"):
+        lat = stats.latency.get(ep, [])
+        if not lat:
+            continue
+        err = stats.errors.get(ep, 0) * 100.0 / len(lat)
+        print(f"{ep:<10}{len(lat):>8}{err:>8.2f}{percentile(lat, 50):>10.1f}"
+              f"{percentile(lat, 95):>10.1f}{percentile(lat, 99):>10.1f}")
+    print(f"下注成功 {stats.accepted} 次，被拒 {stats.rejected} 次")
+
+    if sweep_result:
+        still_active, after_sweep = count_leaked(sweep_result["code"], sweep_result["swept_at"])
+        print(f"\n锁注：{sweep_result['swept_at']:%H:%M:%S.%f} code={sweep_result['code']} rows={sweep_result['rows']}")
+        print(f"锁注后仍为 active：{still_active} 条；晚于锁注时间入库：{after_sweep} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,26 @@
 import os
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
 
 db = SQLAlchemy()
 
+# SQLite 只有 INTEGER PRIMARY KEY 才自增；BIGINT 主键在 SQLite（如本地拆库）上按 INTEGER 建表，
+# 并加 AUTOINCREMENT：否则删掉最大 id 后会复用，归档表里按原 id 保存的行会撞主键
+_BigIntPK = db.BigInteger().with_variant(db.Integer(), "sqlite")
+_SQLITE_AUTOINC = {"sqlite_autoincrement": True}
+
 class Bet2D(db.Model):
     __tablename__ = 'bets_2d'
-    id = db.Column(db.BigInteger, primary_key=True)
+    __table_args__ = _SQLITE_AUTOINC
+    id = db.Column(_BigIntPK, primary_key=True)
     order_code = db.Column(db.String(16))
     agent_id = db.Column(db.String(64), nullable=False)
     market = db.Column(db.String(64), nullable=False)  
     code = db.Column(db.String(13), nullable=False)   # YYYYMMDD/HHMM
-    number = db.Column(db.String(2), nullable=False)  # '00'..'99'
+    number = db.Column(db.String(2), nullable=False)  # '00'..'99'；多号码注单为 '**'
+    number_mask  = db.Column(db.String(25))           # 多号码：100 位掩码的十六进制（见 number_mask_2d）
+    number_count = db.Column(db.SmallInteger, nullable=False, default=1, server_default='1')
 
     amount_n1 = db.Column(db.Numeric(12,2), default=0)
     amount_n  = db.Column(db.Numeric(12,2), default=0)
@@ -26,7 +35,8 @@ class Bet2D(db.Model):
 
 class WinningRecord2D(db.Model):
     __tablename__ = 'winning_record_2d'
-    id = db.Column(db.BigInteger, primary_key=True)
+    __table_args__ = _SQLITE_AUTOINC
+    id = db.Column(_BigIntPK, primary_key=True)
     bet_id   = db.Column(db.BigInteger, db.ForeignKey('bets_2d.id', ondelete='CASCADE'), nullable=False)
     agent_id = db.Column(db.String(64), nullable=False)
     market   = db.Column(db.String(64), nullable=False)
@@ -53,6 +63,7 @@ class DrawResult(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('code', 'market', name='uq_draw_code_market'),
+        db.Index('ix_draw_market_code', 'market', 'code'),   # 按市场取最近 N 期
     )
 
 class Agent(db.Model):
@@ -62,3 +73,177 @@ class Agent(db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
     is_active     = db.Column(db.Boolean, default=True)
     created_at    = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+
+# ---------- 冷数据归档（按天） ----------
+class Bet2DArchive(db.Model):
+    """已结算旧日期的注单，由 archive_2d.py 从 bets_2d 整天搬入（delete 行不搬，直接清理）"""
+    __tablename__ = 'bets_2d_archive'
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)  # 沿用 bets_2d.id
+    day = db.Column(db.Date, nullable=False, index=True)                 # 按开奖 code 的日期分区
+    order_code = db.Column(db.String(16))
+    agent_id = db.Column(db.String(64), nullable=False)
+    market = db.Column(db.String(64), nullable=False)
+    code = db.Column(db.String(13), nullable=False)
+    number = db.Column(db.String(2), nullable=False)
+    number_mask  = db.Column(db.String(25))
+    number_count = db.Column(db.SmallInteger, nullable=False, default=1, server_default='1')
+
+    amount_n1 = db.Column(db.Numeric(12,2), default=0)
+    amount_n  = db.Column(db.Numeric(12,2), default=0)
+    amount_b  = db.Column(db.Numeric(12,2), default=0)
+    amount_s  = db.Column(db.Numeric(12,2), default=0)
+    amount_ds = db.Column(db.Numeric(12,2), default=0)
+    amount_ss = db.Column(db.Numeric(12,2), default=0)
+
+    status = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True))
+    locked_at  = db.Column(db.DateTime(timezone=True))
+
+class WinningRecord2DArchive(db.Model):
+    __tablename__ = 'winning_record_2d_archive'
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    day      = db.Column(db.Date, nullable=False, index=True)
+    bet_id   = db.Column(db.BigInteger, nullable=False)                  # 指向 bets_2d_archive.id
+    agent_id = db.Column(db.String(64), nullable=False)
+    market   = db.Column(db.String(64), nullable=False)
+    code     = db.Column(db.String(13), nullable=False)
+    number   = db.Column(db.String(2), nullable=False)
+
+    hit_type = db.Column(db.String(12), nullable=False)
+    stake    = db.Column(db.Numeric(12,2), nullable=False)
+    odds     = db.Column(db.Numeric(10,2), nullable=False)
+    payout   = db.Column(db.Numeric(12,2), nullable=False)
+
+    created_at = db.Column(db.DateTime(timezone=True))
+
+class ArchivedDay2D(db.Model):
+    """归档清单：一行 = 已整体移出在线表的一天；读路径据此决定是否去查归档表"""
+    __tablename__ = 'archived_days_2d'
+    day          = db.Column(db.Date, primary_key=True)
+    bets         = db.Column(db.Integer, nullable=False, default=0)
+    wins         = db.Column(db.Integer, nullable=False, default=0)
+    purged       = db.Column(db.Integer, nullable=False, default=0)  # 清理掉的 delete 行
+    archived_at  = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+
+
+# ---------- 开奖统计（draw_stats_2d.py 增量维护） ----------
+class DrawNumberStat2D(db.Model):
+    """每市场、每个滚动窗口（最近 N 期）内各号码作为头奖/特别奖的出现次数"""
+    __tablename__ = 'draw_number_stats_2d'
+    market        = db.Column(db.String(64), primary_key=True)
+    window        = db.Column(db.Integer, primary_key=True)
+    number        = db.Column(db.String(2), primary_key=True)
+    head_hits     = db.Column(db.Integer, nullable=False, default=0)
+    special_hits  = db.Column(db.Integer, nullable=False, default=0)
+
+class DrawWindowStat2D(db.Model):
+    """每市场、每个滚动窗口内的期数与 大/小/单/双 次数"""
+    __tablename__ = 'draw_window_stats_2d'
+    market = db.Column(db.String(64), primary_key=True)
+    window = db.Column(db.Integer, primary_key=True)
+    draws  = db.Column(db.Integer, nullable=False, default=0)
+    big    = db.Column(db.Integer, nullable=False, default=0)
+    small  = db.Column(db.Integer, nullable=False, default=0)
+    odd    = db.Column(db.Integer, nullable=False, default=0)
+    even   = db.Column(db.Integer, nullable=False, default=0)
+
+class DrawMarketStat2D(db.Model):
+    """每市场的游标与当前连开：last_code 之后的新开奖走增量，其余情况按窗口重建"""
+    __tablename__ = 'draw_market_stats_2d'
+    market        = db.Column(db.String(64), primary_key=True)
+    last_code     = db.Column(db.String(20))
+    size_streak   = db.Column(db.String(2))                     # 大/小
+    size_streak_len   = db.Column(db.Integer, nullable=False, default=0)
+    parity_streak = db.Column(db.String(2))                     # 单/双
+    parity_streak_len = db.Column(db.Integer, nullable=False, default=0)
+    head_gaps     = db.Column(db.Text)                          # 100 个整数，逗号分隔：各号码距上次开头奖的期数
+    updated_at    = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now())
+
+
+# ---------- 中奖汇总（win_summary_2d.py 在结算事务内重算） ----------
+class WinningSummary2D(db.Model):
+    """每期·市场·代理：各玩法命中条数、下注合计、赔付合计（含本金）"""
+    __tablename__ = 'winning_summary_2d'
+    code          = db.Column(db.String(13), primary_key=True)
+    market        = db.Column(db.String(64), primary_key=True)
+    agent_id      = db.Column(db.String(64), primary_key=True)
+    day           = db.Column(db.Date, nullable=False, index=True)
+    hits_n1       = db.Column(db.Integer, nullable=False, default=0)
+    hits_n_head   = db.Column(db.Integer, nullable=False, default=0)
+    hits_n_special = db.Column(db.Integer, nullable=False, default=0)
+    hits_b        = db.Column(db.Integer, nullable=False, default=0)
+    hits_s        = db.Column(db.Integer, nullable=False, default=0)
+    hits_ds       = db.Column(db.Integer, nullable=False, default=0)
+    hits_ss       = db.Column(db.Integer, nullable=False, default=0)
+    total_stake   = db.Column(db.Numeric(14,2), nullable=False, default=0)
+    total_return  = db.Column(db.Numeric(14,2), nullable=False, default=0)   # stake + payout
+
+class WinningDaySummary2D(db.Model):
+    """每天·代理：由 winning_summary_2d 汇总而来，结算页顶部直接读取"""
+    __tablename__ = 'winning_day_summary_2d'
+    day           = db.Column(db.Date, primary_key=True)
+    agent_id      = db.Column(db.String(64), primary_key=True)
+    hits_n1       = db.Column(db.Integer, nullable=False, default=0)
+    hits_n_head   = db.Column(db.Integer, nullable=False, default=0)
+    hits_n_special = db.Column(db.Integer, nullable=False, default=0)
+    hits_b        = db.Column(db.Integer, nullable=False, default=0)
+    hits_s        = db.Column(db.Integer, nullable=False, default=0)
+    hits_ds       = db.Column(db.Integer, nullable=False, default=0)
+    hits_ss       = db.Column(db.Integer, nullable=False, default=0)
+    total_stake   = db.Column(db.Numeric(14,2), nullable=False, default=0)
+    total_return  = db.Column(db.Numeric(14,2), nullable=False, default=0)
+
+class SummarizedDay2D(db.Model):
+    """每天一行：该日汇总已按中奖记录整体重算过（补算完成），此后由结算逐期维护"""
+    __tablename__ = 'summarized_days_2d'
+    day           = db.Column(db.Date, primary_key=True)
+    codes         = db.Column(db.Integer, nullable=False, default=0)
+    summarized_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+
+
+# ---------- 结算摘要（settle_digest_2d.py 在结算事务内写入，reconcile_2d 比对） ----------
+class SettleDigest2D(db.Model):
+    """每期·市场·代理·引擎：该引擎算出的中奖行数与行哈希之和（32 位十六进制）"""
+    __tablename__ = 'settle_digest_2d'
+    code          = db.Column(db.String(13), primary_key=True)
+    market        = db.Column(db.String(64), primary_key=True)
+    agent_id      = db.Column(db.String(64), primary_key=True)
+    engine        = db.Column(db.String(12), primary_key=True)   # scheduler / web
+    day           = db.Column(db.Date, nullable=False, index=True)
+    rows          = db.Column(db.Integer, nullable=False, default=0)
+    digest        = db.Column(db.String(32), nullable=False)
+
+class SettledCode2D(db.Model):
+    """每期·引擎：该引擎已结算过这一期（没有中奖也有一行）"""
+    __tablename__ = 'settled_code_2d'
+    code          = db.Column(db.String(13), primary_key=True)
+    engine        = db.Column(db.String(12), primary_key=True)
+    day           = db.Column(db.Date, nullable=False, index=True)
+    settled_at    = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+
+
+# ---------- upsert ----------
+_UPSERT_CHUNK = 500
+
+
+def upsert(sess, model, rows: list[dict]) -> None:
+    """
+    按主键 INSERT ... ON CONFLICT DO UPDATE（PostgreSQL / SQLite），并发写同一主键不会撞唯一约束；
+    其它库退回逐行 merge。只执行，不提交。
+    """
+    if not rows:
+        return
+    insert = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}.get(
+        sess.get_bind(mapper=model.__mapper__).dialect.name)
+    if insert is None:
+        for r in rows:
+            sess.merge(model(**r))
+        return
+    keys = [c.name for c in model.__table__.primary_key]
+    for i in range(0, len(rows), _UPSERT_CHUNK):
+        stmt = insert(model.__table__).values(rows[i:i + _UPSERT_CHUNK])
+        sess.execute(stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={c: stmt.excluded[c] for c in rows[0] if c not in keys},
+        ))
@@ -0,0 +1,227 @@
+"""
+多号码注单：一行注单用 100 位号码掩码（第 n 位 = 号码 n）表示同一组金额下的多个号码，
+代替按号码逐行展开。
+
+- bets_2d.number_mask：掩码的 25 位十六进制；单号码注单为 NULL（行为不变）
+- bets_2d.number_count：掩码内号码个数（单号码为 1），财务营业额直接乘它
+- bets_2d.number：掩码注单固定为 MASK_NUMBER
+
+口径：N1/N 每个号码各自一份金额（与逐行展开一致）；大/小/单/双与号码无关，
+命中时本金 = 金额 × 号码个数，记一条中奖记录（number = MASK_NUMBER）。
+
+号码表达式（下注页“号码”栏）：逗号/空格/+ 分隔，取并集
+    12  5  00-49  单/ODD  双/EVEN  大/BIG(50-99)  小/SMALL(00-49)  头3/H3  尾7/T7  全/ALL
+
+应用启动时（app.ensure_schema）会自动给各库补这两列；AUTO_SCHEMA=0 关闭自动建表时手动执行：
+
+    python number_mask_2d.py --init    # 给 bets_2d / bets_2d_archive 补两列（各分库同样处理）
+"""
+import argparse
+import re
+from decimal import Decimal
+
+from sqlalchemy import inspect, text
+
+MASK_NUMBER = "**"
+ALL = (1 << 100) - 1
+_HEX_WIDTH = 25
+
+
+# ---------- 基本操作 ----------
+def from_numbers(numbers) -> int:
+    mask = 0
+    for n in numbers:
+        n = int(n)
+        if not 0 <= n <= 99:
+            raise ValueError(f"号码超出范围：{n}")
+        mask |= 1 << n
+    return mask
+
+
+def numbers(mask: int) -> list[str]:
+    return [f"{n:02d}" for n in range(100) if mask >> n & 1]
+
+
+def contains(mask: int, number: str) -> bool:
+    return number.isdigit() and 0 <= int(number) <= 99 and bool(mask >> int(number) & 1)
+
+
+def count(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def to_hex(mask: int) -> str:
+    return f"{mask:0{_HEX_WIDTH}x}"
+
+
+def from_hex(s: str | None) -> int:
+    return int(s, 16) if s else 0
+
+
+# ---------- 展开辅助 ----------
+def span(lo: int, hi: int) -> int:
+    """[lo, hi] 闭区间；lo > hi 时自动对调"""
+    lo, hi = sorted((lo, hi))
+    return from_numbers(range(lo, hi + 1))
+
+
+def heads(digit: int) -> int:
+    """十位为 digit：头3 = 30-39"""
+    return span(digit * 10, digit * 10 + 9)
+
+
+def tails(digit: int) -> int:
+    """个位为 digit：尾7 = 07, 17, ..., 97"""
+    return from_numbers(range(digit, 100, 10))
+
+
+ODD = from_numbers(range(1, 100, 2))
+EVEN = from_numbers(range(0, 100, 2))
+BIG = span(50, 99)
+SMALL = span(0, 49)
+
+_WORDS = {
+    "单": ODD, "ODD": ODD, "双": EVEN, "EVEN": EVEN,
+    "大": BIG, "BIG": BIG, "小": SMALL, "SMALL": SMALL,
+    "全": ALL, "ALL": ALL, "*": ALL,
+}
+_HEAD_RE = re.compile(r"^(?:头|H)(\d)$")
+_TAIL_RE = re.compile(r"^(?:尾|T)(\d)$")
+_SPAN_RE = re.compile(r"^(\d{1,2})-(\d{1,2})$")
+
+
+def parse(spec: str) -> int:
+    """号码表达式 -> 掩码；无法识别时抛 ValueError"""
+    mask = 0
+    for tok in re.split(r"[,，\s+]+", (spec or "").strip().upper()):
+        if not tok:
+            continue
+        if tok in _WORDS:
+            mask |= _WORDS[tok]
+        elif tok.isdigit() and len(tok) <= 2:
+            mask |= from_numbers([tok])
+        elif m := _SPAN_RE.match(tok):
+            mask |= span(int(m.group(1)), int(m.group(2)))
+        elif m := _HEAD_RE.match(tok):
+            mask |= heads(int(m.group(1)))
+        elif m := _TAIL_RE.match(tok):
+            mask |= tails(int(m.group(1)))
+        else:
+            raise ValueError(f"无法识别的号码：{tok}")
+    return mask
+
+
+def describe(mask: int) -> str:
+    """掩码 -> 简写文本，优先用单/双/大/小/全/头N/尾N，其余按连续区间：'00-09,15,20-29'"""
+    for word in ("全", "单", "双", "大", "小"):
+        if mask == _WORDS[word]:
+            return word
+    for d in range(10):
+        if mask == tails(d):
+            return f"尾{d}"
+    parts, n = [], 0
+    while n < 100:
+        if not mask >> n & 1:
+            n += 1
+            continue
+        start = n
+        while n + 1 < 100 and mask >> (n + 1) & 1:
+            n += 1
+        parts.append(f"{start:02d}" if start == n else f"{start:02d}-{n:02d}")
+        n += 1
+    return ",".join(parts)
+
+
+# ---------- 注单 ----------
+def bet_mask(b) -> int | None:
+    """注单的号码掩码；单号码注单返回 None"""
+    return from_hex(b.number_mask) if getattr(b, "number_mask", None) else None
+
+
+def bet_numbers(b) -> list[str]:
+    mask = bet_mask(b)
+    return numbers(mask) if mask is not None else [b.number]
+
+
+def bet_label(b) -> str:
+    mask = bet_mask(b)
+    return describe(mask) if mask is not None else b.number
+
+
+def number_hits(b, head: str, specials) -> list[tuple[str, str, Decimal]]:
+    """
+    N1/N 的命中：[(hit_type, 号码, 本金)]。两套结算共用。
+    单号码注单只看 b.number；掩码注单逐个检查头奖与特别奖是否落在掩码内。
+    """
+    mask = bet_mask(b)
+    if mask is None:
+        candidates = [b.number] if b.number == head or b.number in specials else []
+    else:
+        candidates = [n for n in dict.fromkeys([head, *sorted(specials)]) if contains(mask, n)]
+
+    hits = []
+    for number in candidates:
+        if number == head:
+            if Decimal(b.amount_n1 or 0) > 0:
+                hits.append(("N1", number, Decimal(b.amount_n1)))
+            if Decimal(b.amount_n or 0) > 0:
+                hits.append(("N_HEAD", number, Decimal(b.amount_n)))
+        elif Decimal(b.amount_n or 0) > 0:
+            hits.append(("N_SPECIAL", number, Decimal(b.amount_n)))
+    return hits
+
+
+def attr_number(b) -> str:
+    """大小单双中奖记录的号码：掩码注单记 MASK_NUMBER"""
+    return MASK_NUMBER if bet_mask(b) is not None else b.number
+
+
+def attr_stake(b, amount) -> Decimal:
+    """大小单双的命中本金：掩码注单按号码个数放大（与逐行展开的合计一致）"""
+    return Decimal(amount) * (getattr(b, "number_count", None) or 1)
+
+
+# ---------- 建列 ----------
+_COLUMNS = {
+    "number_mask": "VARCHAR(25)",
+    "number_count": "SMALLINT NOT NULL DEFAULT 1",
+}
+
+
+def init_columns(engine) -> list[str]:
+    """给已有库的 bets_2d / bets_2d_archive 补列，返回新加的 表.列"""
+    added = []
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in ("bets_2d", "bets_2d_archive"):
+            if not insp.has_table(table):
+                continue
+            have = {c["name"] for c in insp.get_columns(table)}
+            for col, ddl in _COLUMNS.items():
+                if col not in have:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col} {ddl}"))
+                    added.append(f"{table}.{col}")
+    return added
+
+
+def main():
+    ap = argparse.ArgumentParser(description="2D 多号码掩码注单")
+    ap.add_argument("--init", action="store_true", help="给已有库补 number_mask / number_count 列")
+    ap.add_argument("--parse", metavar="SPEC", help="试算号码表达式，如 '00-49' '尾7' '单'")
+    args = ap.parse_args()
+
+    if args.parse:
+        mask = parse(args.parse)
+        print(f"{describe(mask)}  共 {count(mask)} 个  hex={to_hex(mask)}")
+    if args.init:
+        from app import create_app
+        from models import db
+        app = create_app()
+        with app.app_context():
+            for key, engine in db.engines.items():
+                added = init_columns(engine)
+                print(f"[mask] {key or 'default'}：" + (", ".join(added) or "无需变更"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+赔率 what-if 模拟：把一段时间的真实注单与开奖一次性载入为列数组，
+再在任意多组候选赔率下重新计算庄家利润率（可选蒙特卡洛随机开奖）。
+
+返还（含本金）对赔率是线性的：return = Σ_c odds_c × 命中本金_c，
+所以先算出各玩法的“命中本金”向量，再与 (玩法 × 方案) 的赔率矩阵相乘，
+几百个方案也只是一次矩阵乘法。
+
+    python odds_sim_2d.py --start 2025-06-01 --end 2025-08-31 \\
+        --scenario N_SPECIAL=6.5 --scenario N_SPECIAL=6.5,N_HEAD=38 \\
+        --grid N_SPECIAL=6:7.5:0.1 --mc 500 --by-month
+
+口径同 /2d/winning 结算：排除 delete；market 逗号分隔时每个市场各算一份；多号码掩码注单按号码个数计；
+大小/单双取开奖的 size_type/parity_type，缺失时按头奖推算（同调度验奖）。
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import numpy as np
+
+from odds_config_2d import ODDS_2D
+import number_mask_2d
+
+HIT_TYPES = ["N1", "N_HEAD", "N_SPECIAL", "B", "S", "DS", "SS"]
+
+
+@dataclass
+class SimData:
+    # 开奖（D 期·市场）
+    draw_head: np.ndarray        # (D,) int16，-1 表示无效
+    draw_specials: np.ndarray    # (D, 100) bool
+    draw_big: np.ndarray         # (D,) bool
+    draw_small: np.ndarray
+    draw_odd: np.ndarray
+    draw_even: np.ndarray
+    draw_month: np.ndarray       # (D,) int32 月序号
+    months: list[str]
+    # 按期聚合的下注（D × 100 / D）
+    stake_n1: np.ndarray         # (D, 100) 各号码 N1 金额
+    stake_n: np.ndarray          # (D, 100) 各号码 N 金额
+    stake_b: np.ndarray          # (D,)
+    stake_s: np.ndarray
+    stake_ds: np.ndarray
+    stake_ss: np.ndarray
+
+    @property
+    def turnover_by_draw(self) -> np.ndarray:
+        return (self.stake_n1.sum(1) + self.stake_n.sum(1)
+                + self.stake_b + self.stake_s + self.stake_ds + self.stake_ss)
+
+
+def load(start: date, end: date) -> SimData:
+    """一次性从库里载入 [start, end] 的开奖与注单（含已归档日期）"""
+    from app import create_app
+    from models import db, Bet2D, Bet2DArchive, DrawResult
+    from shards_2d import all_sessions
+
+    app = create_app()
+    with app.app_context():
+        lo, hi = start.strftime("%Y%m%d"), end.strftime("%Y%m%d") + "/9999"
+        draws = (db.session.query(DrawResult.code, DrawResult.market, DrawResult.head,
+                                  DrawResult.specials, DrawResult.size_type, DrawResult.parity_type)
+                 .filter(DrawResult.code >= lo, DrawResult.code <= hi)
+                 .all())
+        cols = lambda m: (m.code, m.market, m.number, m.number_mask, m.number_count,
+                          m.amount_n1, m.amount_n, m.amount_b, m.amount_s, m.amount_ds, m.amount_ss)
+        bets = []
+        for sess in all_sessions():   # 按市场拆库时逐库载入
+            bets += (sess.query(*cols(Bet2D))
+                     .filter(Bet2D.status != "delete", Bet2D.code >= lo, Bet2D.code <= hi)
+                     .all())
+            bets += (sess.query(*cols(Bet2DArchive))
+                     .filter(Bet2DArchive.day >= start, Bet2DArchive.day <= end)
+                     .all())
+
+    D = len(draws)
+    index = {}
+    head = np.full(D, -1, dtype=np.int16)
+    specials = np.zeros((D, 100), dtype=bool)
+    size = np.empty(D, dtype=object)
+    parity = np.empty(D, dtype=object)
+    month_of = np.zeros(D, dtype=np.int32)
+    months: list[str] = []
+    for i, (code, market, h, sp, st, pt) in enumerate(draws):
+        index[(code, (market or "").replace(" ", ""))] = i
+        try:
+            head[i] = int((h or "").strip())
+        except ValueError:
+            pass
+        for x in (sp or "").split(","):
+            x = x.strip()
+            if x.isdigit() and 0 <= int(x) <= 99:
+                specials[i, int(x)] = True
+        size[i], parity[i] = st, pt
+        mk = code[:6]
+        if mk not in months:
+            months.append(mk)
+        month_of[i] = months.index(mk)
+    valid = (head >= 0) & (head <= 99)
+    big = np.where(np.isin(size, ["大", "小"]), size == "大", valid & (head >= 50))
+    small = np.where(np.isin(size, ["大", "小"]), size == "小", valid & (head < 50))
+    odd = np.where(np.isin(parity, ["单", "双"]), parity == "单", valid & (head % 2 == 1))
+    even = np.where(np.isin(parity, ["单", "双"]), parity == "双", valid & (head % 2 == 0))
+
+    # 注单按 (期·市场) 展开成扁平数组，再按期/号码 bincount 聚合；
+    # 多号码掩码注单单独收集，N1/N 按掩码位铺到各号码，大小单双 × 号码个数
+    d_idx, num, amts = [], [], []
+    md_idx, masks, mamts = [], [], []
+    for code, market, number, mask_hex, n_count, n1, n, b, s, ds, ss in bets:
+        row = [float(v or 0) for v in (n1, n, b, s, ds, ss)]
+        for m in (market or "").replace(" ", "").split(","):
+            i = index.get((code, m))
+            if i is None:
+                continue
+            if mask_hex:
+                md_idx.append(i)
+                masks.append(number_mask_2d.from_hex(mask_hex))
+                mamts.append(row[:2] + [v * (n_count or 1) for v in row[2:]])
+            elif (number or "").isdigit():
+                d_idx.append(i)
+                num.append(int(number))
+                amts.append(row)
+    d_idx = np.asarray(d_idx, dtype=np.int64)
+    num = np.asarray(num, dtype=np.int64)
+    amts = np.asarray(amts, dtype=np.float64).reshape(-1, 6)
+    flat = d_idx * 100 + num
+    md_idx = np.asarray(md_idx, dtype=np.int64)
+    mamts = np.asarray(mamts, dtype=np.float64).reshape(-1, 6)
+    bits = np.array([[m >> k & 1 for k in range(100)] for m in masks], dtype=np.float64).reshape(-1, 100)
+
+    def per_cell(col):
+        out = np.bincount(flat, weights=amts[:, col], minlength=D * 100).reshape(D, 100)
+        np.add.at(out, md_idx, bits * mamts[:, col:col + 1])
+        return out
+
+    def per_draw(col):
+        return (np.bincount(d_idx, weights=amts[:, col], minlength=D)
+                + np.bincount(md_idx, weights=mamts[:, col], minlength=D))
+
+    # 月序号按时间排序
+    order = np.argsort(months)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(months))
+    return SimData(
+        draw_head=head, draw_specials=specials,
+        draw_big=big.astype(bool), draw_small=small.astype(bool),
+        draw_odd=odd.astype(bool), draw_even=even.astype(bool),
+        draw_month=remap[month_of] if months else month_of,
+        months=sorted(months),
+        stake_n1=per_cell(0), stake_n=per_cell(1),
+        stake_b=per_draw(2), stake_s=per_draw(3), stake_ds=per_draw(4), stake_ss=per_draw(5),
+    )
+
+
+def hit_stakes(data: SimData, head: np.ndarray, specials: np.ndarray,
+               big, small, odd, even) -> np.ndarray:
+    """给定每期开奖，返回 (D, 7) 各玩法命中本金（列顺序同 HIT_TYPES）"""
+    D = len(head)
+    rows = np.arange(D)
+    ok = (head >= 0) & (head <= 99)
+    h = np.where(ok, head, 0)
+    n1 = np.where(ok, data.stake_n1[rows, h], 0.0)
+    nh = np.where(ok, data.stake_n[rows, h], 0.0)
+    sp = specials.copy()
+    sp[rows[ok], h[ok]] = False            # 头奖优先，不重复算特别奖
+    ns = (data.stake_n * sp).sum(1)
+    return np.stack([n1, nh, ns,
+                     data.stake_b * big, data.stake_s * small,
+                     data.stake_ds * odd, data.stake_ss * even], axis=1)
+
+
+def odds_matrix(scenarios: list[dict]) -> np.ndarray:
+    """(7, K) 含本金倍率矩阵；方案中未给出的玩法沿用 ODDS_2D"""
+    return np.array([[float(sc.get(k, ODDS_2D[k])) for sc in scenarios] for k in HIT_TYPES])
+
+
+def historical(data: SimData, scenarios: list[dict]) -> dict:
+    hs = hit_stakes(data, data.draw_head, data.draw_specials,
+                    data.draw_big, data.draw_small, data.draw_odd, data.draw_even)
+    odds = odds_matrix(scenarios)
+    turnover = data.turnover_by_draw
+    M = len(data.months)
+    hs_m = np.zeros((M, 7))
+    np.add.at(hs_m, data.draw_month, hs)
+    to_m = np.bincount(data.draw_month, weights=turnover, minlength=M)
+    returns = hs.sum(0) @ odds                 # (K,)
+    returns_m = hs_m @ odds                    # (M, K)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin_m = np.where(to_m[:, None] > 0, 1 - returns_m / to_m[:, None], np.nan)
+    total = turnover.sum()
+    return {
+        "turnover": total,
+        "returns": returns,
+        "margin": 1 - returns / total if total else np.full(len(scenarios), np.nan),
+        "margin_by_month": margin_m,
+    }
+
+
+def monte_carlo(data: SimData, scenarios: list[dict], sims: int, seed: int = 0,
+                chunk: int = 4) -> np.ndarray:
+    """随机开奖 sims 次（头奖均匀、特别奖个数同历史且互不重复），返回 (sims, K) 利润率"""
+    rng = np.random.default_rng(seed)
+    odds = odds_matrix(scenarios)
+    total = data.turnover_by_draw.sum()
+    D = len(data.draw_head)
+    n_sp = data.draw_specials.sum(1)
+    k_max = int(n_sp.max()) if D else 0
+    out = np.empty((sims, odds.shape[1]))
+    for s0 in range(0, sims, chunk):
+        r = min(chunk, sims - s0)
+        heads = rng.integers(0, 100, size=(r, D))
+        keys = rng.random((r, D, 100), dtype=np.float32)
+        np.put_along_axis(keys, heads[..., None], np.inf, axis=2)      # 特别奖不与头奖重复
+        specials = np.zeros((r, D, 100), dtype=bool)
+        if k_max:
+            top = np.argpartition(keys, k_max - 1, axis=2)[..., :k_max]
+            take = np.arange(k_max)[None, None, :] < n_sp[None, :, None]
+            np.put_along_axis(specials, top, take, axis=2)
+        for j in range(r):
+            h = heads[j]
+            hs = hit_stakes(data, h, specials[j], h >= 50, h < 50, h % 2 == 1, h % 2 == 0)
+            out[s0 + j] = 1 - (hs.sum(0) @ odds) / total if total else np.nan
+    return out
+
+
+# ---------- CLI ----------
+def _parse_scenario(s: str) -> dict:
+    sc = {}
+    for part in s.split(","):
+        k, v = part.split("=")
+        k = k.strip().upper()
+        if k not in HIT_TYPES:
+            raise SystemExit(f"未知玩法：{k}（可选 {', '.join(HIT_TYPES)}）")
+        sc[k] = float(v)
+    return sc
+
+
+def _parse_grid(s: str) -> list[dict]:
+    k, rng = s.split("=")
+    lo, hi, step = (float(x) for x in rng.split(":"))
+    k = k.strip().upper()
+    if k not in HIT_TYPES:
+        raise SystemExit(f"未知玩法：{k}")
+    return [{k: round(v, 6)} for v in np.arange(lo, hi + step / 2, step)]
+
+
+def _label(sc: dict) -> str:
+    return ",".join(f"{k}={v:g}" for k, v in sc.items()) or "当前赔率"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="2D 赔率 what-if 模拟")
+    ap.add_argument("--start", required=True, help="YYYY-MM-DD")
+    ap.add_argument("--end", required=True, help="YYYY-MM-DD")
+    ap.add_argument("--scenario", action="append", default=[], help="如 N_SPECIAL=6.5,N_HEAD=38")
+    ap.add_argument("--grid", action="append", default=[], help="如 N_SPECIAL=6:7.5:0.1")
+    ap.add_argument("--mc", type=int, default=0, help="蒙特卡洛次数（0 = 不跑）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--by-month", action="store_true", help="按月输出历史利润率")
+    args = ap.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d").date()
+    end = datetime.strptime(args.end, "%Y-%m-%d").date()
+    scenarios = [{}] + [_parse_scenario(s) for s in args.scenario]
+    for g in args.grid:
+        scenarios += _parse_grid(g)
+
+    t0 = datetime.now()
+    data = load(start, end)
+    t1 = datetime.now()
+    hist = historical(data, scenarios)
+    mc = monte_carlo(data, scenarios, args.mc, args.seed) if args.mc else None
+    t2 = datetime.now()
+
+    print(f"载入 {len(data.draw_head)} 期·市场，耗时 {(t1 - t0).total_seconds():.2f}s；"
+          f"{len(scenarios)} 个方案计算耗时 {(t2 - t1).total_seconds():.2f}s")
+    print(f"营业额 RM {hist['turnover']:.2f}")
+    header = f"{'方案':<32}{'返还':>14}{'利润率':>9}"
+    if mc is not None:
+        header += f"{'MC均值':>9}{'MC p5':>9}{'MC p95':>9}"
+    print(header)
+    for k, sc in enumerate(scenarios):
+        line = f"{_label(sc):<32}{hist['returns'][k]:>14.2f}{hist['margin'][k]:>9.2%}"
+        if mc is not None:
+            col = mc[:, k]
+            line += f"{np.nanmean(col):>9.2%}{np.nanpercentile(col, 5):>9.2%}{np.nanpercentile(col, 95):>9.2%}"
+        print(line)
+
+    if args.by_month:
+        print("\n按月利润率")
+        print(f"{'月份':<8}" + "".join(f"{_label(sc)[:14]:>16}" for sc in scenarios))
+        for i, m in enumerate(data.months):
+            print(f"{m:<8}" + "".join(f"{hist['margin_by_month'][i, k]:>16.2%}" for k in range(len(scenarios))))
+
+
+if __name__ == "__main__":
+    main()
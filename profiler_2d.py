@@ -0,0 +1,212 @@
+"""
+按需采样分析：管理员在 /admin/profiles 里“预约”某个路由的接下来 N 次请求
+（或某个调度任务的接下来 N 次运行），命中时起一个采样线程，按固定间隔抓取
+目标线程的调用栈，结束后写成 collapsed-stack（.folded）文件，可直接喂给
+flamegraph.pl / speedscope。
+
+- 预约状态存在 PROFILE_DIR/armed.json，web 各 worker 与调度进程共用
+- 未预约时每次请求只做一次内存字典查找；预约文件最多每 2 秒重新读一次
+- 采样间隔 PROFILE_INTERVAL_MS（默认 5ms）
+"""
+import fcntl
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from zoneinfo import ZoneInfo
+
+MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000.0
+SCHEDULER_PREFIX = "scheduler:"
+# 可在管理页预约的调度任务（与 run_scheduler_2d.py 中的任务函数同名）
+SCHEDULER_JOBS = ["job_lock_bets_2d", "job_process_winning_2d", "job_sync_draw_stats_2d",
+                  "job_backfill_win_summary_2d", "job_archive_2d"]
+
+_ARMED_FILE = os.path.join(PROFILE_DIR, "armed.json")
+_RELOAD_EVERY = 2.0
+_cache = {"checked": 0.0, "armed": {}}
+
+
+# ---------- 预约状态 ----------
+@contextmanager
+def _locked_state():
+    """独占读写 armed.json，产出可修改的 dict，退出时写回"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_ARMED_FILE, "a+") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            fh.seek(0)
+            try:
+                state = json.loads(fh.read() or "{}")
+            except ValueError:
+                state = {}
+            yield state
+            fh.seek(0)
+            fh.truncate()
+            fh.write(json.dumps(state))
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+    _cache["armed"] = dict(state)
+    _cache["checked"] = time.monotonic()
+
+
+def armed_targets() -> dict:
+    """{target: 剩余次数}；带 2 秒缓存，关闭状态下几乎零开销"""
+    now = time.monotonic()
+    if now - _cache["checked"] > _RELOAD_EVERY:
+        _cache["checked"] = now
+        try:
+            with open(_ARMED_FILE) as fh:
+                _cache["armed"] = json.loads(fh.read() or "{}")
+        except (OSError, ValueError):
+            _cache["armed"] = {}
+    return _cache["armed"]
+
+
+def arm(target: str, count: int):
+    with _locked_state() as state:
+        if count > 0:
+            state[target] = int(count)
+        else:
+            state.pop(target, None)
+
+
+def _claim(target: str) -> bool:
+    """原子地占用一次预约名额"""
+    with _locked_state() as state:
+        left = int(state.get(target, 0))
+        if left <= 0:
+            state.pop(target, None)
+            return False
+        if left == 1:
+            state.pop(target)
+        else:
+            state[target] = left - 1
+        return True
+
+
+# ---------- 采样 ----------
+def _frame_label(frame) -> str:
+    co = frame.f_code
+    return f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})".replace(";", ":")
+
+
+class Sampler:
+    """在后台线程里周期抓取 thread_id 的调用栈，累计成 collapsed stacks"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.started = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            parts = []
+            while frame is not None:
+                parts.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(parts))] += 1
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self.started
+
+
+def _write(target: str, sampler: Sampler, elapsed: float) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    ts = datetime.now(MY_TZ).strftime("%Y%m%d-%H%M%S-%f")
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", target)
+    path = os.path.join(PROFILE_DIR, f"{ts}_{safe}_{int(elapsed * 1000)}ms.folded")
+    with open(path, "w") as fh:
+        for stack, n in sampler.stacks.most_common():
+            fh.write(f"{stack} {n}\n")
+    return path
+
+
+@contextmanager
+def profiled(target: str):
+    """若 target 已预约则采样当前线程，否则什么都不做"""
+    if target not in armed_targets() or not _claim(target):
+        yield
+        return
+    sampler = Sampler(threading.get_ident()).start()
+    try:
+        yield
+    finally:
+        _write(target, sampler, sampler.stop())
+
+
+def profiled_job(fn):
+    """调度任务装饰器：预约目标为 scheduler:<函数名>"""
+    target = SCHEDULER_PREFIX + fn.__name__
+
+    @wraps(fn)
+    def _wrap(*a, **kw):
+        with profiled(target):
+            return fn(*a, **kw)
+    return _wrap
+
+
+def list_profiles() -> list[dict]:
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if n.endswith(".folded")]
+    except OSError:
+        return []
+    out = []
+    for name in sorted(names, reverse=True):
+        path = os.path.join(PROFILE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        out.append({
+            "name": name,
+            "size": st.st_size,
+            "mtime": datetime.fromtimestamp(st.st_mtime, MY_TZ).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    return out
+
+
+def profile_path(name: str) -> str | None:
+    """只允许访问 PROFILE_DIR 下的 .folded 文件"""
+    if not name.endswith(".folded") or os.path.basename(name) != name:
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+# ---------- Flask 接入 ----------
+def init_profiler(app):
+    from flask import g, request
+
+    @app.before_request
+    def _profile_start():
+        ep = request.endpoint
+        if ep and ep in armed_targets() and _claim(ep):
+            g._profile_sampler = (ep, Sampler(threading.get_ident()).start())
+
+    @app.teardown_request
+    def _profile_stop(exc=None):
+        item = g.pop("_profile_sampler", None)
+        if item is not None:
+            ep, sampler = item
+            _write(ep, sampler, sampler.stop())
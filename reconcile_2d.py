@@ -0,0 +1,201 @@
+"""
+结算对账：调度验奖（job_process_winning_2d）与结算页（compute_and_persist_wins_for_date）
+对同一天算出的中奖集合是否一致。
+
+- 两套结算各自在结算事务里写下 (期号, 市场, 代理) 的摘要（行数 + 行哈希之和，见 settle_digest_2d），
+  这里只读摘要表按 (日期, 市场, 代理) 合并比较，不重算注单
+- 只比较在各库都有两套结算标记的期号；其余开奖期号（早于摘要功能结算、结算页没打开过、
+  只有一套结算过）计入“未核对”，原样列出
+- 摘要不同的桶才按两套规则重新取该代理当天的注单逐行比对（已归档的日期从 bets_2d_archive 读注单）
+
+    python reconcile_2d.py --start 2025-06-01 --end 2025-06-30 [--limit 20] [--json]
+
+全部一致且没有未核对的期号时退出码为 0；有差异或有未核对的期号为 1
+（未核对不等于没有差异：打开该日结算页补结算后重跑即可覆盖）。
+"""
+import argparse
+import json
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from app import web_hits, ODDS_2D_MULTIPLIER
+from models import db, Bet2D, Bet2DArchive, DrawResult, ArchivedDay2D
+from odds_config_2d import ODDS_2D
+from run_scheduler_2d import app, scheduler_hits
+from settle_digest_2d import ENGINES, MOD, norm_row
+import settle_digest_2d
+from shards_2d import named_sessions, row_key
+
+
+def _row(bet_key: str, b, hit_type: str, number: str, stake, odds) -> tuple:
+    """逐行比对用的中奖行：注单标识（带库名，拆库时不串号）+ 与结算摘要相同的归一化行"""
+    return (bet_key,) + norm_row(b.code, hit_type, number, stake, odds)
+
+
+# ---------- 取数 ----------
+def _draws_by_code(day: date) -> dict[str, list]:
+    prefix = day.strftime("%Y%m%d") + "/%"
+    out = {}
+    for dr in db.session.query(DrawResult).filter(DrawResult.code.like(prefix)):
+        out.setdefault(dr.code, []).append(dr)
+    return out
+
+
+def _bets(day: date, archived: bool, agent: str | None = None, market: str | None = None):
+    model = Bet2DArchive if archived else Bet2D
+    cols = [model.id, model.agent_id, model.market, model.code, model.number,
+            model.number_mask, model.number_count, model.status,
+            model.amount_n1, model.amount_n, model.amount_b, model.amount_s, model.amount_ds, model.amount_ss]
+    prefix = day.strftime("%Y%m%d") + "/%"
+    for shard, sess in named_sessions():
+        q = sess.query(*cols).filter(model.code.like(prefix), model.status != "delete")
+        if agent is not None:
+            q = q.filter(model.agent_id == agent)
+        if market is not None:
+            q = q.filter(model.market.like(f"%{market}%"))   # 粗筛，精确匹配在下面按各引擎规则做
+        for b in q.yield_per(5000):
+            yield row_key(shard, b.id), b
+
+
+# ---------- 两套规则 ----------
+def engine_rows(bet_key: str, b, draws: list) -> dict[str, list[tuple[str, tuple]]]:
+    """一注对当期所有开奖，返回 {引擎: [(市场, 中奖行)]}"""
+    out = {e: [] for e in ENGINES}
+    bet_markets = (b.market or "").replace(" ", "").split(",")
+
+    # 结算页：status != delete，注单市场串包含开奖市场
+    for dr in draws:
+        mkt_norm = (dr.market or "").replace(" ", "")
+        if mkt_norm not in bet_markets:
+            continue
+        head = (dr.head or "").strip()
+        specials_set = {s.strip() for s in (dr.specials or "").split(",") if s.strip()}
+        for hit_type, number, stake in web_hits(b, dr, head, specials_set):
+            out["web"].append((mkt_norm, _row(bet_key, b, hit_type, number, stake, ODDS_2D_MULTIPLIER[hit_type])))
+
+    # 调度：只结算 locked，注单市场串须与开奖市场完全相同（同市场多条开奖时后者覆盖前者）
+    if b.status == "locked":
+        draw_map = {dr.market: dr for dr in draws}
+        dr = draw_map.get(b.market)
+        if dr is not None:
+            head = (dr.head or "").strip()
+            specials = [x.strip() for x in (dr.specials or "").split(",") if x.strip()]
+            for hit_type, number, stake in scheduler_hits(b, head, specials):
+                out["scheduler"].append((dr.market.replace(" ", ""), _row(bet_key, b, hit_type, number, stake, ODDS_2D[hit_type])))
+    return out
+
+
+# ---------- 对账 ----------
+def day_digests(day: date) -> tuple[dict[tuple, dict[str, tuple[int, int]]], set, list[str]]:
+    """
+    各库结算摘要合并：({(市场, 代理): {引擎: (行数, 哈希和)}}, 已比较的期号, 未核对的期号)。
+    期号须在每个库都有两套引擎的结算标记才参与比较；其余开奖期号（早于摘要功能结算的、
+    结算页没打开过的、只有一套结算过的）都算未核对
+    """
+    sessions = [sess for _, sess in named_sessions()]
+    draw_codes = set(_draws_by_code(day))
+    verified = set(draw_codes)
+    for sess in sessions:
+        verified &= {c for c, es in settle_digest_2d.settled_codes(sess, day).items() if set(ENGINES) <= es}
+
+    acc: dict = {}
+    if verified:
+        for sess in sessions:
+            for key, dg in settle_digest_2d.day_digests(sess, day, verified).items():
+                d = acc.setdefault(key, {e: [0, 0] for e in ENGINES})
+                for e, (n, h) in dg.items():
+                    d[e][0] += n
+                    d[e][1] = (d[e][1] + h) % MOD
+    return ({k: {e: tuple(v) for e, v in d.items()} for k, d in acc.items()},
+            verified, sorted(draw_codes - verified))
+
+
+def diff_bucket(day: date, archived: bool, market: str, agent: str, codes: set) -> dict[str, list[tuple]]:
+    """按两套规则重算一个桶并逐行比对（只看 codes 中的期号），返回只在某一引擎出现的行"""
+    draws = _draws_by_code(day)
+    rows = {e: Counter() for e in ENGINES}
+    for key, b in _bets(day, archived, agent=agent, market=market):
+        if b.code not in draws or b.code not in codes:
+            continue
+        for engine, items in engine_rows(key, b, draws[b.code]).items():
+            rows[engine].update(row for m, row in items if m == market)
+    return {
+        "only_scheduler": sorted((rows["scheduler"] - rows["web"]).elements()),
+        "only_web": sorted((rows["web"] - rows["scheduler"]).elements()),
+    }
+
+
+def reconcile(start: date, end: date, limit: int | None = None) -> dict:
+    archived_days = {d for (d,) in db.session.query(ArchivedDay2D.day)
+                     .filter(ArchivedDay2D.day >= start, ArchivedDay2D.day <= end)}
+    buckets = matched = 0
+    mismatched, unverified = [], []
+    day = start
+    while day <= end:
+        archived = day in archived_days
+        digests, compared, missing = day_digests(day)
+        unverified += missing
+        for (market, agent), dg in sorted(digests.items()):
+            buckets += 1
+            if dg["scheduler"] == dg["web"]:
+                matched += 1
+                continue
+            item = {
+                "day": day.isoformat(), "market": market, "agent": agent,
+                "scheduler_rows": dg["scheduler"][0], "web_rows": dg["web"][0],
+            }
+            if limit is None or len(mismatched) < limit:
+                item.update(diff_bucket(day, archived, market, agent, compared))
+            mismatched.append(item)
+        day += timedelta(days=1)
+    return {
+        "start": start.isoformat(), "end": end.isoformat(),
+        "buckets": buckets, "matched": matched, "unverified": unverified, "mismatched": mismatched,
+    }
+
+
+_ROW_FIELDS = ("bet_id", "code", "number", "hit_type", "stake", "odds", "payout")
+
+
+def _fmt_row(row: tuple) -> str:
+    return " ".join(f"{k}={v}" for k, v in zip(_ROW_FIELDS, row))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="2D 调度验奖 / 结算页 中奖对账")
+    ap.add_argument("--start", required=True, help="YYYY-MM-DD")
+    ap.add_argument("--end", required=True, help="YYYY-MM-DD")
+    ap.add_argument("--limit", type=int, default=20, help="最多逐行比对多少个不一致的桶（其余只列摘要）")
+    ap.add_argument("--json", action="store_true", help="输出 JSON")
+    args = ap.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d").date()
+    end = datetime.strptime(args.end, "%Y-%m-%d").date()
+    with app.app_context():
+        rep = reconcile(start, end, args.limit)
+
+    if args.json:
+        for item in rep["mismatched"]:
+            for k in ("only_scheduler", "only_web"):
+                if k in item:
+                    item[k] = [dict(zip(_ROW_FIELDS, r)) for r in item[k]]
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+    else:
+        print(f"[reconcile] {rep['start']} ~ {rep['end']} 桶={rep['buckets']} "
+              f"一致={rep['matched']} 不一致={len(rep['mismatched'])} 未核对期号={len(rep['unverified'])}")
+        for item in rep["mismatched"]:
+            print(f"  {item['day']} {item['market']} {item['agent']} "
+                  f"调度={item['scheduler_rows']} 结算页={item['web_rows']}")
+            for r in item.get("only_scheduler", []):
+                print(f"    - 仅调度  {_fmt_row(r)}")
+            for r in item.get("only_web", []):
+                print(f"    + 仅结算页 {_fmt_row(r)}")
+        if rep["unverified"]:
+            per_day = Counter(c[:8] for c in rep["unverified"])
+            print("  未核对：" + ", ".join(f"{d} {n} 期" for d, n in sorted(per_day.items())))
+    sys.exit(1 if rep["mismatched"] or rep["unverified"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,16 @@ from apscheduler.triggers.cron import CronTrigger
 from models import db, Bet2D, WinningRecord2D, DrawResult
 from odds_config_2d import ODDS_2D
 from app import create_app
+from archive_2d import archive_day, days_to_archive
+from profiler_2d import profiled_job
+from draw_stats_2d import sync_all
+from settle_digest_2d import Digest
+from shards_2d import all_sessions
+from win_summary_2d import summarize_or_defer, backfill_missing
+import number_mask_2d
 
 MY_TZ = ZoneInfo("Asia/Kuala_Lumpur")
+BACKFILL_DAYS_PER_RUN = 30   # 每次补算最多多少天（每库），积压多时分几轮追平
 
 app = create_app()
 scheduler = BackgroundScheduler(timezone=str(MY_TZ))
@@ -26,20 +34,48 @@ def _to_int2(s: str) -> int:
         return -1
 
 
+def scheduler_hits(b, head: str, specials: list[str]) -> list[tuple[str, str, Decimal]]:
+    """调度验奖的命中规则：一注对一期开奖，返回 [(hit_type, 号码, stake)]（大小单双按头奖推算）"""
+    head_i = _to_int2(head)
+    is_big = (0 <= head_i <= 99) and (head_i >= 50)
+    is_odd = (0 <= head_i <= 99) and (head_i % 2 == 1)
+
+    # N1 / N（分头奖/特奖），单号码或多号码掩码
+    hits = number_mask_2d.number_hits(b, head, specials)
+
+    # 属性类按头奖，多号码注单本金 × 号码个数
+    num = number_mask_2d.attr_number(b)
+    if Decimal(b.amount_b or 0) > 0 and is_big:
+        hits.append(("B", num, number_mask_2d.attr_stake(b, b.amount_b)))
+    if Decimal(b.amount_s or 0) > 0 and not is_big and head_i >= 0:
+        hits.append(("S", num, number_mask_2d.attr_stake(b, b.amount_s)))
+    if Decimal(b.amount_ds or 0) > 0 and is_odd:
+        hits.append(("DS", num, number_mask_2d.attr_stake(b, b.amount_ds)))
+    if Decimal(b.amount_ss or 0) > 0 and not is_odd and head_i >= 0:
+        hits.append(("SS", num, number_mask_2d.attr_stake(b, b.amount_ss)))
+    return hits
+
+
+@profiled_job
 def job_lock_bets_2d():
+    """锁注：把当期 active 注单置为 locked；返回 (code, 锁注时间, 行数)，供压测脚本复用。"""
     with app.app_context():
         now = datetime.now(MY_TZ)
         slot_code = code_for_slot(now)
-        q = (Bet2D.query
-             .filter(Bet2D.code == slot_code, Bet2D.status == 'active'))
-        updated = q.update({
-            Bet2D.status: 'locked',
-            Bet2D.locked_at: now
-        }, synchronize_session=False)
-        db.session.commit()
+        updated = 0
+        for sess in all_sessions():   # 按市场拆库时逐库锁注
+            q = (sess.query(Bet2D)
+                 .filter(Bet2D.code == slot_code, Bet2D.status == 'active'))
+            updated += q.update({
+                Bet2D.status: 'locked',
+                Bet2D.locked_at: now
+            }, synchronize_session=False)
+            sess.commit()
         print(f"[2D] {now:%F %T} 锁注完成：code={slot_code}，rows={updated}")
+        return slot_code, now, updated
 
 
+@profiled_job
 def job_process_winning_2d():
     with app.app_context():
         now = datetime.now(MY_TZ)
@@ -55,71 +91,99 @@ def job_process_winning_2d():
             print(f"[2D] {now:%F %T} 未找到当期开什么：code={slot_code}，跳过")
             return
 
-        # 幂等：清理当期旧中奖记录
-        WinningRecord2D.query.filter_by(code=slot_code).delete()
-        db.session.commit()
-
         total_hits = 0
-        bets = Bet2D.query.filter(Bet2D.code == slot_code, Bet2D.status == 'locked').all()
-
-        for b in bets:
-            if b.market not in draw_map:
-                continue
-            head = draw_map[b.market]["head"]
-            specials = draw_map[b.market]["specials"]
-
-            head_i = _to_int2(head)
-            is_big = (0 <= head_i <= 99) and (head_i >= 50)
-            is_odd = (0 <= head_i <= 99) and (head_i % 2 == 1)
-
-            def emit(hit_type: str, stake: Decimal, odds_key: str):
-                nonlocal total_hits
-                if stake is None:
-                    return
-                stake = Decimal(stake)
-                if stake <= 0:
-                    return
-                odds = ODDS_2D[odds_key]
-                payout = stake * (odds - Decimal("1"))
-                db.session.add(WinningRecord2D(
-                    bet_id=b.id, agent_id=b.agent_id, market=b.market,
-                    code=b.code, number=b.number,
-                    hit_type=hit_type, stake=stake, odds=odds, payout=payout
-                ))
-                total_hits += 1
-
-            # N1
-            if Decimal(b.amount_n1 or 0) > 0 and b.number == head:
-                emit("N1", b.amount_n1, "N1")
-
-            # N（分头奖/特奖）
-            if Decimal(b.amount_n or 0) > 0:
-                if b.number == head:
-                    emit("N_HEAD", b.amount_n, "N_HEAD")
-                elif b.number in specials:
-                    emit("N_SPECIAL", b.amount_n, "N_SPECIAL")
-
-            # 属性类按头奖
-            if Decimal(b.amount_b or 0) > 0 and is_big:
-                emit("B", b.amount_b, "B")
-            if Decimal(b.amount_s or 0) > 0 and not is_big and head_i >= 0:
-                emit("S", b.amount_s, "S")
-            if Decimal(b.amount_ds or 0) > 0 and is_odd:
-                emit("DS", b.amount_ds, "DS")
-            if Decimal(b.amount_ss or 0) > 0 and not is_odd and head_i >= 0:
-                emit("SS", b.amount_ss, "SS")
-
-        db.session.commit()
+        for sess in all_sessions():   # 按市场拆库时逐库结算，中奖记录写在注单所在库
+            # 幂等：清理当期旧中奖记录
+            sess.query(WinningRecord2D).filter_by(code=slot_code).delete()
+            sess.commit()
+
+            bets = sess.query(Bet2D).filter(Bet2D.code == slot_code, Bet2D.status == 'locked').all()
+            digest = Digest("scheduler")
+            digest.settle(slot_code)
+
+            for b in bets:
+                if b.market not in draw_map:
+                    continue
+                head = draw_map[b.market]["head"]
+                specials = draw_map[b.market]["specials"]
+
+                for hit_type, number, stake in scheduler_hits(b, head, specials):
+                    odds = ODDS_2D[hit_type]
+                    payout = stake * (odds - Decimal("1"))
+                    digest.add(slot_code, b.market.replace(" ", ""), b.agent_id, hit_type, number, stake, odds)
+                    sess.add(WinningRecord2D(
+                        bet_id=b.id, agent_id=b.agent_id, market=b.market,
+                        code=b.code, number=number,
+                        hit_type=hit_type, stake=stake, odds=odds, payout=payout
+                    ))
+                    total_hits += 1
+
+            if not summarize_or_defer(sess, [slot_code]):   # 汇总失败只回滚汇总，交给补算任务
+                print(f"[2D] {now:%F %T} 中奖汇总重算失败：code={slot_code}，已交给补算任务")
+            try:
+                with sess.begin_nested():   # 摘要只供对账，写失败不影响本期结算
+                    digest.save(sess)
+            except Exception as e:
+                print(f"[2D] {now:%F %T} 结算摘要写入失败：code={slot_code}，{e}")
+            sess.commit()
+
         print(f"[2D] {now:%F %T} 验奖完成：code={slot_code}，命中记录数={total_hits}")
 
 
-# 调度（09:49–23:49 锁注；09:52–23:52 验奖）
-scheduler.add_job(job_lock_bets_2d, CronTrigger(hour="9-23", minute=49, timezone=str(MY_TZ)), id="lock_bets_2d", replace_existing=True)
-scheduler.add_job(job_process_winning_2d, CronTrigger(hour="9-23", minute=52, timezone=str(MY_TZ)), id="process_winning_2d", replace_existing=True)
+@profiled_job
+def job_sync_draw_stats_2d():
+    """库外录入/更正的开奖：追平冷热统计。独立于验奖，失败只影响统计"""
+    with app.app_context():
+        now = datetime.now(MY_TZ)
+        try:
+            changed = sync_all(db.session)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[2D] {now:%F %T} 冷热统计同步失败：{e}")
+            return
+        print(f"[2D] {now:%F %T} 冷热统计同步完成：markets={','.join(changed) or '无变化'}")
+
+
+@profiled_job
+def job_backfill_win_summary_2d():
+    """补算没有补算标记的日期的中奖汇总（早于汇总功能、只汇总了一部分、结算时汇总失败过）"""
+    with app.app_context():
+        now = datetime.now(MY_TZ)
+        try:
+            done = backfill_missing(limit=BACKFILL_DAYS_PER_RUN, upto=now.date())
+        except Exception as e:
+            for sess in all_sessions():
+                sess.rollback()
+            print(f"[2D] {now:%F %T} 中奖汇总补算失败：{e}")
+            return
+        print(f"[2D] {now:%F %T} 中奖汇总补算完成：天数={len(done)}")
 
-scheduler.start()
-print("[2D] Scheduler started.")
 
-# worker 常驻
-while True:
-    time.sleep(3600)
+@profiled_job
+def job_archive_2d():
+    with app.app_context():
+        now = datetime.now(MY_TZ)
+        ready, unsettled = days_to_archive()
+        done = [archive_day(d) for d in ready]
+        moved = sum(r["bets"] for r in done)
+        print(f"[2D] {now:%F %T} 归档完成：天数={len(done)}，注单={moved}，未结算跳过={len(unsettled)}")
+
+
+if __name__ == "__main__":
+    # 调度（09:49–23:49 锁注；09:52–23:52 验奖）
+    scheduler.add_job(job_lock_bets_2d, CronTrigger(hour="9-23", minute=49, timezone=str(MY_TZ)), id="lock_bets_2d", replace_existing=True)
+    scheduler.add_job(job_process_winning_2d, CronTrigger(hour="9-23", minute=52, timezone=str(MY_TZ)), id="process_winning_2d", replace_existing=True)
+    # 09:55–23:55 追平冷热统计（开奖多为库外录入）
+    scheduler.add_job(job_sync_draw_stats_2d, CronTrigger(hour="9-23", minute=55, timezone=str(MY_TZ)), id="sync_draw_stats_2d", replace_existing=True)
+    # 09:58–23:58 补算没有标记的日期的中奖汇总（含验奖时汇总失败的当天）
+    scheduler.add_job(job_backfill_win_summary_2d, CronTrigger(hour="9-23", minute=58, timezone=str(MY_TZ)), id="backfill_win_summary_2d", replace_existing=True)
+    # 每日 04:30（非营业时段）归档超过保留期的日期
+    scheduler.add_job(job_archive_2d, CronTrigger(hour=4, minute=30, timezone=str(MY_TZ)), id="archive_2d", replace_existing=True)
+
+    scheduler.start()
+    print("[2D] Scheduler started.")
+
+    # worker 常驻
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,106 @@
+"""
+结算摘要：调度验奖与结算页在写中奖记录的同一事务里，各自记下本次算出的中奖集合摘要，
+reconcile_2d 直接比对摘要，不再按注单重算。
+
+- settle_digest_2d：每 (期号, 市场, 代理, 引擎) 一行，行数 + 行哈希之和（与顺序无关）；只记有中奖的桶
+- settled_code_2d：每 (期号, 引擎) 一行，标记该引擎已结算过该期（没有中奖也记）
+- 与中奖记录同库（按市场拆库时各库各有一份）；写入用 upsert，调度与结算页并发结算同一期不会冲突
+- 行哈希不含注单 id：拆库搬迁后注单换了 id，摘要仍然有效
+"""
+import hashlib
+from datetime import datetime
+from decimal import Decimal
+
+from models import db, upsert, SettleDigest2D, SettledCode2D
+
+ENGINES = ("scheduler", "web")
+_CENT = Decimal("0.01")
+MOD = 1 << 128
+
+
+def _q(v) -> str:
+    return str(Decimal(v).quantize(_CENT))
+
+
+def day_of(code: str):
+    return datetime.strptime(code[:8], "%Y%m%d").date()
+
+
+def norm_row(code: str, hit_type: str, number: str, stake, odds) -> tuple:
+    """归一化的中奖行：金额统一到分，赔率统一两位小数（1.9 与 1.90 视为相同）"""
+    stake, odds = Decimal(stake), Decimal(odds)
+    return (code, number, hit_type, _q(stake), _q(odds), _q(stake * (odds - Decimal("1"))))
+
+
+def row_hash(row: tuple) -> int:
+    return int.from_bytes(hashlib.blake2b("|".join(map(str, row)).encode(), digest_size=16).digest(), "big")
+
+
+class Digest:
+    """一个引擎对若干期的结算摘要，边结算边 add，最后 save 到结算所用的会话"""
+
+    def __init__(self, engine: str):
+        self.engine = engine
+        self.codes: set[str] = set()
+        self.buckets: dict = {}   # (code, market, agent_id) -> [行数, 哈希和]
+
+    def settle(self, code: str) -> None:
+        """标记该期已由本引擎结算（即便没有任何中奖）"""
+        self.codes.add(code)
+
+    def add(self, code: str, market: str, agent_id: str, hit_type: str, number: str, stake, odds) -> None:
+        self.codes.add(code)
+        acc = self.buckets.setdefault((code, market, agent_id), [0, 0])
+        acc[0] += 1
+        acc[1] = (acc[1] + row_hash(norm_row(code, hit_type, number, stake, odds))) % MOD
+
+    def save(self, sess) -> None:
+        """写入 sess 所在库：已结算期号整体替换为本次结果，只写有变化的行；只 flush，不提交"""
+        if not self.codes:
+            return
+        sess.flush()
+        codes = sorted(self.codes)
+        want = {k: (n, f"{h:032x}") for k, (n, h) in self.buckets.items()}
+        have = {}
+        for r in sess.query(SettleDigest2D).filter(SettleDigest2D.engine == self.engine,
+                                                   SettleDigest2D.code.in_(codes)):
+            if (r.code, r.market, r.agent_id) in want:
+                have[(r.code, r.market, r.agent_id)] = (r.rows, r.digest)
+            else:
+                sess.delete(r)   # 这次没有中奖的桶（撤单、改开奖后）
+        upsert(sess, SettleDigest2D, [
+            dict(code=code, market=market, agent_id=agent_id, engine=self.engine,
+                 day=day_of(code), rows=n, digest=h)
+            for (code, market, agent_id), (n, h) in want.items() if have.get((code, market, agent_id)) != (n, h)
+        ])
+        marked = {c for (c,) in sess.query(SettledCode2D.code)
+                  .filter(SettledCode2D.engine == self.engine, SettledCode2D.code.in_(codes))}
+        upsert(sess, SettledCode2D, [
+            dict(code=code, engine=self.engine, day=day_of(code), settled_at=db.func.now())
+            for code in codes if code not in marked
+        ])
+        sess.flush()
+
+
+def settled_codes(sess, day) -> dict[str, set]:
+    """sess 所在库某天已结算的期号：{期号: {引擎}}"""
+    out: dict = {}
+    for code, engine in (sess.query(SettledCode2D.code, SettledCode2D.engine)
+                         .filter(SettledCode2D.day == day)):
+        out.setdefault(code, set()).add(engine)
+    return out
+
+
+def day_digests(sess, day, codes: set) -> dict:
+    """读 sess 所在库某天、限于 codes 的摘要：{(市场, 代理): {引擎: (行数, 哈希和)}}"""
+    out: dict = {}
+    for code, market, agent_id, engine, n, h in (
+            sess.query(SettleDigest2D.code, SettleDigest2D.market, SettleDigest2D.agent_id,
+                       SettleDigest2D.engine, SettleDigest2D.rows, SettleDigest2D.digest)
+            .filter(SettleDigest2D.day == day)):
+        if code not in codes:
+            continue
+        acc = out.setdefault((market, agent_id), {e: [0, 0] for e in ENGINES})[engine]
+        acc[0] += n
+        acc[1] = (acc[1] + int(h, 16)) % MOD
+    return {k: {e: tuple(v) for e, v in d.items()} for k, d in out.items()}
@@ -0,0 +1,252 @@
+"""
+按市场水平拆库（可选）：BET_SHARDS 配置的市场，其注单/中奖/归档表放在独立数据库。
+
+    BET_SHARDS="MGV21=postgresql://.../bets_mgv21;UCA68=sqlite:////data/uca68.db"
+
+- 未配置的市场仍在默认库（DATABASE_URL），行为不变
+- 下注写入按市场拆行：一行 "MGV21,UCA68" 在 MGV21 拆库时变成分库一行 "MGV21" +
+  默认库一行 "UCA68"（金额相同，合计口径不变）
+- 结算、锁注按市场路由；历史/中奖/财务等跨市场视图对所有库扇出后合并
+- 中奖汇总、结算摘要跟随中奖记录所在的库；开奖、代理、统计、归档清单等小表始终在默认库
+- 各库的自增 id 各自独立，跨库合并时用 (库名, id) 区分，不能只看 id
+- 拆库后下注不走组提交（BET_WRITER=group 只对默认库生效）：先逐库 flush 再逐库提交，
+  部分库已提交后其余库提交失败时按已提交行数返回，不报失败
+- 拆库涉及的查询只用 PostgreSQL / SQLite 通用的写法（|| 拼接、期号字符串比较日期），
+  本地可以用几个 SQLite 文件当分库测试
+
+    python shards_2d.py --init              # 在各分库建表
+    python shards_2d.py --migrate MGV21     # 把默认库里该市场的旧注单/中奖搬到分库
+"""
+import argparse
+import os
+
+from flask import current_app
+from sqlalchemy import literal
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from models import (
+    db, Bet2D, WinningRecord2D, Bet2DArchive, WinningRecord2DArchive,
+    WinningSummary2D, WinningDaySummary2D, SummarizedDay2D, SettleDigest2D, SettledCode2D, upsert,
+)
+
+
+def _parse(raw: str) -> dict[str, str]:
+    out = {}
+    for part in (raw or "").split(";"):
+        if "=" not in part:
+            continue
+        market, url = part.split("=", 1)
+        if market.strip() and url.strip():
+            out[market.strip()] = url.strip()
+    return out
+
+
+SHARDS = _parse(os.environ.get("BET_SHARDS", ""))   # market -> url
+
+
+def bind_key(market: str) -> str:
+    return f"shard_{market}"
+
+
+def shard_binds() -> dict[str, str]:
+    """供 SQLALCHEMY_BINDS 使用"""
+    return {bind_key(m): url for m, url in SHARDS.items()}
+
+
+def enabled() -> bool:
+    return bool(SHARDS)
+
+
+def shard_tables():
+    return [Bet2D.__table__, WinningRecord2D.__table__,
+            Bet2DArchive.__table__, WinningRecord2DArchive.__table__,
+            WinningSummary2D.__table__, WinningDaySummary2D.__table__, SummarizedDay2D.__table__,
+            SettleDigest2D.__table__, SettledCode2D.__table__]
+
+
+# ---------- 会话 ----------
+_makers: dict = {}   # engine -> scoped_session
+
+
+def _shard_session(market: str):
+    engine = db.engines[bind_key(market)]
+    sm = _makers.get(engine)
+    if sm is None:
+        sm = _makers[engine] = scoped_session(sessionmaker(bind=engine))
+    return sm
+
+
+def session_for(market: str):
+    """该市场注单所在库的会话；未拆库的市场返回 db.session"""
+    return _shard_session(market) if market in SHARDS else db.session
+
+
+DEFAULT = "default"
+
+
+def named_sessions() -> list[tuple[str, object]]:
+    """[(库名, 会话)]：默认库名为 DEFAULT，分库名为市场"""
+    return [(DEFAULT, db.session)] + [(m, _shard_session(m)) for m in SHARDS]
+
+
+def all_sessions() -> list:
+    """默认库 + 各分库，跨市场读取时逐个查询后合并"""
+    return [sess for _, sess in named_sessions()]
+
+
+def row_key(shard: str, row_id) -> str:
+    """跨库唯一的行标识：'MGV21:123'；默认库不加前缀，与未拆库时一致"""
+    return str(row_id) if shard == DEFAULT else f"{shard}:{row_id}"
+
+
+def remove_sessions(exc=None):
+    for sm in _makers.values():
+        sm.remove()
+
+
+def init_shards(app):
+    app.teardown_appcontext(remove_sessions)
+
+
+# ---------- 写入 ----------
+def split_rows(rows: list[dict]) -> list[tuple[object, dict]]:
+    """把逗号分隔多市场的注单行按库拆开，返回 [(session, row)]"""
+    out = []
+    for r in rows:
+        markets = [m for m in (r.get("market") or "").split(",") if m]
+        local = [m for m in markets if m not in SHARDS]
+        for m in markets:
+            if m in SHARDS:
+                out.append((session_for(m), dict(r, market=m)))
+        if local:
+            out.append((db.session, dict(r, market=",".join(local))))
+    return out
+
+
+def write_bets(rows: list[dict]) -> int:
+    """
+    按库插入：先逐库 flush（约束错误在任何库提交之前暴露，此时全部回滚并抛出），再逐库提交。
+    提交阶段若某库失败而此前已有库提交成功，不再抛异常，返回已提交的行数——
+    与组提交一致，不会出现“报失败但已入库”，避免用户重试造成重复下注。
+    组提交写线程只持有默认库会话，拆库时下注走这里、不经过组提交（启动时会记一条警告）。
+    """
+    by_session: dict = {}
+    for sess, row in split_rows(rows):
+        by_session.setdefault(sess, []).append(row)
+    try:
+        for sess, items in by_session.items():
+            sess.add_all([Bet2D(**r) for r in items])
+            sess.flush()
+    except Exception:
+        for sess in by_session:
+            sess.rollback()
+        raise
+
+    created = 0
+    for sess, items in by_session.items():
+        try:
+            sess.commit()
+        except Exception:
+            sess.rollback()
+            if created == 0:
+                for other in by_session:
+                    other.rollback()
+                raise
+            current_app.logger.exception("拆库下注部分提交失败，已提交 %d 行", created)
+            continue
+        created += len(items)
+    return created
+
+
+# ---------- 运维 ----------
+def init_tables():
+    for m in SHARDS:
+        db.metadata.create_all(db.engines[bind_key(m)], tables=shard_tables())
+
+
+_BET_COLS = ["order_code", "agent_id", "market", "code", "number", "number_mask", "number_count",
+             "amount_n1", "amount_n", "amount_b", "amount_s", "amount_ds", "amount_ss",
+             "status", "created_at", "locked_at"]
+_DIGEST_COLS = ["code", "market", "agent_id", "engine", "day", "rows", "digest"]
+_MARK_COLS = ["code", "engine", "day", "settled_at"]
+_WIN_COLS = ["agent_id", "market", "code", "number", "hit_type", "stake", "odds", "payout", "created_at"]
+
+
+def migrate_market(market: str, chunk: int = 1000) -> int:
+    """
+    把默认库中含 market 的注单搬到分库（多市场行只拆出该市场），连带该市场的中奖记录。
+    先提交分库、再提交默认库；中途失败需人工核对后重跑。
+    """
+    if market not in SHARDS:
+        raise SystemExit(f"{market} 未在 BET_SHARDS 中配置")
+    from win_summary_2d import summarize_codes
+
+    src, dst = db.session, session_for(market)
+    pattern = f"%,{market},%"
+    moved = 0
+    while True:
+        bets = (src.query(Bet2D)
+                .filter((literal(",") + Bet2D.market + ",").like(pattern))
+                .order_by(Bet2D.id)
+                .limit(chunk)
+                .all())
+        if not bets:
+            break
+        # 整批插入分库、flush 一次拿到新 id，再按旧 id 对应搬中奖记录
+        new_bets = [Bet2D(**dict({c: getattr(b, c) for c in _BET_COLS}, market=market)) for b in bets]
+        dst.add_all(new_bets)
+        dst.flush()
+        new_id = {b.id: nb.id for b, nb in zip(bets, new_bets)}
+        others = {b.id: [m for m in b.market.split(",") if m and m != market] for b in bets}
+
+        wins = src.query(WinningRecord2D).filter(WinningRecord2D.bet_id.in_(list(new_id))).all()
+        for w in wins:
+            # 旧调度结算的 market 存的是整串；单市场行的中奖全部随行搬走
+            if w.market == market or not others[w.bet_id]:
+                dst.add(WinningRecord2D(bet_id=new_id[w.bet_id], **{c: getattr(w, c) for c in _WIN_COLS}))
+                src.delete(w)
+        for b in bets:
+            if others[b.id]:
+                b.market = ",".join(others[b.id])
+            else:
+                src.delete(b)
+        moved += len(bets)
+
+        codes = {b.code for b in bets}   # 中奖记录换了库，两边汇总都要重算
+        summarize_codes(dst, codes)
+        summarize_codes(src, codes)
+        _move_digests(src, dst, market, codes)
+        dst.commit()
+        src.commit()
+    return moved
+
+
+def _move_digests(src, dst, market: str, codes) -> None:
+    """该市场的结算摘要随注单搬到分库（摘要不含注单 id，可原样搬），已结算标记两边都保留"""
+    digests = (src.query(SettleDigest2D)
+               .filter(SettleDigest2D.market == market, SettleDigest2D.code.in_(codes)).all())
+    upsert(dst, SettleDigest2D, [{c: getattr(d, c) for c in _DIGEST_COLS} for d in digests])
+    for d in digests:
+        src.delete(d)
+    marks = src.query(SettledCode2D).filter(SettledCode2D.code.in_(codes)).all()
+    upsert(dst, SettledCode2D, [{c: getattr(m, c) for c in _MARK_COLS} for m in marks])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="2D 按市场拆库")
+    ap.add_argument("--init", action="store_true", help="在各分库建表")
+    ap.add_argument("--migrate", metavar="MARKET", help="把默认库中该市场的注单搬到分库")
+    args = ap.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.init:
+            init_tables()
+            print(f"[shards] 已建表：{', '.join(SHARDS) or '无分库'}")
+        if args.migrate:
+            print(f"[shards] {args.migrate} 搬迁注单 {migrate_market(args.migrate)} 行")
+
+
+if __name__ == "__main__":
+    main()
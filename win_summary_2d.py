@@ -0,0 +1,210 @@
+"""
+中奖汇总：结算写中奖记录时，在同一事务内按期号重算汇总行。
+
+- winning_summary_2d：每 (期号, 市场, 代理) 一行，各玩法命中条数 + 下注合计 + 赔付合计（含本金）
+- winning_day_summary_2d：每 (日期, 代理) 一行，由上表按天汇总
+- summarized_days_2d：每天一行，表示该日已按中奖记录整体补算过；之后由结算逐期维护
+- 汇总与中奖记录在同一个库（按市场拆库时各库各有一份，读取时合并）
+- 写入用 upsert，并在 PostgreSQL 上按日期加事务级咨询锁：调度与结算页同时结算同一天不会撞主键，
+  后提交的一方在锁内能看到先提交的中奖记录
+- 结算侧汇总失败只回滚汇总（SAVEPOINT），并撤掉该日的补算标记，由补算任务重算
+- 中奖记录归档后汇总行保留不动；没有补算标记的日期（早于本功能、只汇总了一部分、汇总失败过）
+  由调度任务 job_backfill_win_summary_2d 或命令行补算，页面只读
+
+    python win_summary_2d.py --missing                              # 补算所有没有标记的日期
+    python win_summary_2d.py --start 2025-06-01 --end 2025-06-30   # 指定区间强制重算
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, text
+
+from models import (
+    db, upsert, DrawResult, WinningRecord2D, WinningRecord2DArchive,
+    WinningSummary2D, WinningDaySummary2D, SummarizedDay2D, ArchivedDay2D,
+)
+from shards_2d import all_sessions
+
+# hit_type -> 汇总列
+HIT_COLUMNS = {
+    "N1": "hits_n1",
+    "N_HEAD": "hits_n_head",
+    "N_SPECIAL": "hits_n_special",
+    "B": "hits_b",
+    "S": "hits_s",
+    "DS": "hits_ds",
+    "SS": "hits_ss",
+}
+SUM_FIELDS = list(HIT_COLUMNS.values()) + ["total_stake", "total_return"]
+_LOCK_NS = 0x2D5E   # pg_advisory_xact_lock(命名空间, YYYYMMDD)
+
+
+def day_of(code: str) -> date:
+    return datetime.strptime(code[:8], "%Y%m%d").date()
+
+
+def _empty() -> dict:
+    return {f: (Decimal("0") if f.startswith("total_") else 0) for f in SUM_FIELDS}
+
+
+def _lock_days(sess, days) -> None:
+    """PostgreSQL：按日期串行化汇总重算，锁到事务结束；SQLite 写本来就串行，其它库不加锁"""
+    if sess.get_bind(mapper=WinningSummary2D.__mapper__).dialect.name != "postgresql":
+        return
+    for d in days:   # 已排序，多个日期按同一顺序加锁，不会互相死锁
+        sess.execute(text("SELECT pg_advisory_xact_lock(:ns, :key)"),
+                     {"ns": _LOCK_NS, "key": int(d.strftime("%Y%m%d"))})
+
+
+def _delete_stale(sess, model, where, keep) -> None:
+    """删掉 where 范围内、这次重算已不存在的汇总行（撤单、改开奖后）；通常一行都没有"""
+    keys = [c.name for c in model.__table__.primary_key]
+    pk = [getattr(model, k) for k in keys]
+    for row in sess.query(*pk).filter(where).all():
+        if tuple(row) not in keep:
+            sess.query(model).filter_by(**dict(zip(keys, row))).delete(synchronize_session=False)
+
+
+def _rebuild(sess, codes: list[str], model):
+    """按 model（在线或归档中奖表）重算这些期号的汇总，以及涉及日期的日汇总"""
+    days = sorted({day_of(c) for c in codes})
+    _lock_days(sess, days)
+
+    rows = (sess.query(model.code, model.market, model.agent_id, model.hit_type,
+                       func.count(model.id),
+                       func.coalesce(func.sum(model.stake), 0),
+                       func.coalesce(func.sum(model.stake + model.payout), 0))
+            .filter(model.code.in_(codes))
+            .group_by(model.code, model.market, model.agent_id, model.hit_type)
+            .all())
+    buckets: dict = {}
+    for code, market, agent_id, hit_type, n, stake, ret in rows:
+        acc = buckets.setdefault((code, market, agent_id), _empty())
+        if hit_type in HIT_COLUMNS:
+            acc[HIT_COLUMNS[hit_type]] += n
+        acc["total_stake"] += Decimal(stake)
+        acc["total_return"] += Decimal(ret)
+    _delete_stale(sess, WinningSummary2D, WinningSummary2D.code.in_(codes), buckets)
+    upsert(sess, WinningSummary2D, [
+        dict(code=code, market=market, agent_id=agent_id, day=day_of(code), **acc)
+        for (code, market, agent_id), acc in buckets.items()
+    ])
+
+    per_day = (sess.query(WinningSummary2D.day, WinningSummary2D.agent_id,
+                          *[func.sum(getattr(WinningSummary2D, f)) for f in SUM_FIELDS])
+               .filter(WinningSummary2D.day.in_(days))
+               .group_by(WinningSummary2D.day, WinningSummary2D.agent_id)
+               .all())
+    _delete_stale(sess, WinningDaySummary2D, WinningDaySummary2D.day.in_(days),
+                  {(d, agent_id) for d, agent_id, *_ in per_day})
+    upsert(sess, WinningDaySummary2D, [
+        dict(day=d, agent_id=agent_id, **dict(zip(SUM_FIELDS, sums)))
+        for d, agent_id, *sums in per_day
+    ])
+
+
+def summarize_codes(sess, codes) -> None:
+    """结算在 sess 上写完中奖记录、提交之前调用；只 flush，不提交"""
+    codes = sorted(set(codes))
+    if not codes:
+        return
+    sess.flush()
+    _rebuild(sess, codes, WinningRecord2D)
+
+
+def summarize_or_defer(sess, codes) -> bool:
+    """
+    结算侧用：在 SAVEPOINT 里重算汇总，失败只回滚汇总、不影响中奖记录；
+    同时撤掉涉及日期的补算标记，交给补算任务重算。返回是否成功
+    """
+    codes = sorted(set(codes))
+    try:
+        with sess.begin_nested():
+            summarize_codes(sess, codes)
+        return True
+    except Exception:
+        days = sorted({day_of(c) for c in codes})
+        sess.query(SummarizedDay2D).filter(SummarizedDay2D.day.in_(days)).delete(synchronize_session=False)
+        return False
+
+
+def _day_codes(day: date) -> list[str]:
+    prefix = day.strftime("%Y%m%d") + "/%"
+    return [c for (c,) in db.session.query(DrawResult.code).filter(DrawResult.code.like(prefix)).distinct()]
+
+
+def rebuild_day(sess, day: date) -> int:
+    """按中奖记录（归档日读归档表）重算 sess 所在库该日的全部汇总，并记补算标记；返回期号数"""
+    codes = _day_codes(day)
+    if codes:
+        archived = db.session.get(ArchivedDay2D, day) is not None
+        _rebuild(sess, codes, WinningRecord2DArchive if archived else WinningRecord2D)
+    upsert(sess, SummarizedDay2D, [dict(day=day, codes=len(codes), summarized_at=db.func.now())])
+    return len(codes)
+
+
+def missing_days(sess, upto: date | None = None) -> list[date]:
+    """有开奖、但 sess 所在库还没有补算标记的日期；新日期在前（最常查看的先补）"""
+    prefixes = db.session.query(func.substr(DrawResult.code, 1, 8)).distinct()
+    days = {datetime.strptime(p, "%Y%m%d").date() for (p,) in prefixes if p and p.isdigit()}
+    if upto is not None:
+        days = {d for d in days if d <= upto}
+    done = {d for (d,) in sess.query(SummarizedDay2D.day)}
+    return sorted(days - done, reverse=True)
+
+
+def backfill_missing(limit: int | None = None, upto: date | None = None) -> list[tuple[date, int]]:
+    """各库补算没有标记的日期（从最近的日期往前），每天单独提交；返回 [(日期, 期号数)]（拆库时同一天可能出现多次）"""
+    done = []
+    for sess in all_sessions():
+        for day in missing_days(sess, upto)[:limit]:
+            n = rebuild_day(sess, day)
+            sess.commit()
+            done.append((day, n))
+    return done
+
+
+def merge_rows(rows, key) -> list[dict]:
+    """把各库读出的汇总行按 key 合并成 dict 列表（拆库时同一代理在每个库各有一行）"""
+    out: dict = {}
+    for r in rows:
+        k = key(r)
+        acc = out.get(k)
+        if acc is None:
+            acc = out[k] = {a: getattr(r, a, None) for a in ("day", "code", "market", "agent_id")}
+            acc.update(_empty())
+        for f in SUM_FIELDS:
+            acc[f] += getattr(r, f) or 0
+    return list(out.values())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="2D 中奖汇总补算")
+    ap.add_argument("--start", help="YYYY-MM-DD，与 --end 一起：强制重算该区间")
+    ap.add_argument("--end", help="YYYY-MM-DD")
+    ap.add_argument("--missing", action="store_true", help="补算所有没有补算标记的日期")
+    args = ap.parse_args()
+    if not args.missing and not (args.start and args.end):
+        ap.error("需要 --missing 或 --start/--end")
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if args.missing:
+            for day, n in backfill_missing():
+                print(f"[summary] {day} 期号={n}")
+        if args.start and args.end:
+            day = datetime.strptime(args.start, "%Y-%m-%d").date()
+            end = datetime.strptime(args.end, "%Y-%m-%d").date()
+            while day <= end:
+                n = 0
+                for sess in all_sessions():
+                    n = rebuild_day(sess, day)
+                    sess.commit()
+                print(f"[summary] {day} 期号={n}")
+                day += timedelta(days=1)
+
+
+if __name__ == "__main__":
+    main()